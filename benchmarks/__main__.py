@@ -0,0 +1,31 @@
+import click
+from benchmarks.coldstart import coldstart
+from benchmarks.encoding import encoding
+from benchmarks.endpoints import http, compare
+from benchmarks.indexes import indexes
+from benchmarks.query_budget import budgets
+from benchmarks.replica import replica
+from benchmarks.response_cache import responsecache
+from benchmarks.serializer import serializer
+from benchmarks.stats import stats
+
+
+# Run from the project root: python -m benchmarks <command> --help
+@click.group()
+def cli():
+    pass
+
+
+cli.add_command(http)
+cli.add_command(compare)
+cli.add_command(budgets)
+cli.add_command(indexes)
+cli.add_command(replica)
+cli.add_command(serializer)
+cli.add_command(coldstart)
+cli.add_command(encoding)
+cli.add_command(responsecache)
+cli.add_command(stats)
+
+if __name__ == "__main__":
+    cli()
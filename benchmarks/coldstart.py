@@ -0,0 +1,104 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import click
+from benchmarks.endpoints import ROOT, http_request, prepare_database
+
+# Cold-start benchmark for the gunicorn deployment profile. It starts a
+# single-worker gunicorn and records the time from launch until the worker
+# answers. Then it records the latency of the first request on each route,
+# which is where lazy setup (connects, mapper configuration, serializer
+# compilation, lookup cache loads) shows up, against the same route once
+# warm.
+
+ROUTES = [
+    ("list", "/characters/?limit=100"),
+    ("get", "/characters/1/"),
+    ("search", "/characters/search?q=Uso"),
+    ("lookups", "/lookups/affiliations/"),
+]
+WARM_REPEAT = 20
+
+PROFILES = {
+    # Plain gunicorn on the app factory, as the repo was deployed before
+    "baseline": ["--config", "{empty}", "main:create_app()"],
+    # gunicorn.conf.py: preload, fork-safe engines, warm-up at worker boot
+    "profile": ["--config", os.path.join(ROOT, "gunicorn.conf.py"), "wsgi:app"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(profile, database_url, empty_config):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    args = [arg.format(empty=empty_config) for arg in PROFILES[profile]]
+    env = dict(os.environ, DATABASE_URL=database_url, GUNICORN_WORKERS="1")
+    env.pop("DATABASE_READ_URL", None)
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", "1", "-b", f"127.0.0.1:{port}", *args],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        # Wait for the listening socket, then for the worker to answer
+        for _ in range(300):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.01)
+        else:
+            raise click.ClickException(f"{profile}: gunicorn did not start")
+        # The master accepts connections before the worker is booted, so
+        # readiness is the first answer to a path that touches no database
+        # or serializer (a 404)
+        http_request(base_url, "GET", "/__ready__", None)
+        result = {"ready_s": time.perf_counter() - started}
+        for name, path in ROUTES:
+            latency, status, _ = http_request(base_url, "GET", path, None)
+            if status != 200:
+                raise click.ClickException(f"{profile}: GET {path} returned {status}")
+            result[f"{name}_first_ms"] = latency * 1000
+        for name, path in ROUTES:
+            warm = [http_request(base_url, "GET", path, None)[0] for _ in range(WARM_REPEAT)]
+            result[f"{name}_warm_ms"] = statistics.median(warm) * 1000
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@click.command("coldstart")
+@click.option("--size", default=10000, show_default=True, help="Characters to seed.")
+@click.option("--runs", default=3, show_default=True, help="Server starts per profile; medians are reported.")
+@click.option("--database-url", default=None,
+              help="Database to use, e.g. a local PostgreSQL. It is DROPPED and re-seeded. "
+                   "Defaults to a temporary SQLite file.")
+def coldstart(size, runs, database_url):
+    """Compare cold start and first-request latency with and without gunicorn.conf.py."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = database_url or f"sqlite:///{os.path.join(tmp, 'coldstart.db')}"
+        prepare_database(database_url, size, 0)
+        empty_config = os.path.join(tmp, "empty.conf.py")
+        open(empty_config, "w").close()
+
+        results = {}
+        for profile in PROFILES:
+            runs_data = [measure(profile, database_url, empty_config) for _ in range(runs)]
+            results[profile] = {key: statistics.median(run[key] for run in runs_data) for key in runs_data[0]}
+
+    click.echo(f"{'':22}" + "".join(f"{profile:>12}" for profile in PROFILES))
+    click.echo(f"{'worker ready (s)':22}" + "".join(f"{results[p]['ready_s']:12.3f}" for p in PROFILES))
+    for name, _ in ROUTES:
+        for phase in ("first", "warm"):
+            key = f"{name}_{phase}_ms"
+            click.echo(f"{f'{name} {phase} (ms)':22}" + "".join(f"{results[p][key]:12.2f}" for p in PROFILES))
@@ -0,0 +1,106 @@
+import os
+import statistics
+import tempfile
+import time
+import click
+from flask.json.provider import DefaultJSONProvider
+from benchmarks.endpoints import prepare_database
+from json_provider import OrjsonProvider, orjson
+from compression import brotli, compress_body
+
+# JSON encoding and compression benchmark on a large seeded dataset: the
+# biggest list page and the full NDJSON export, for every combination of
+# JSON provider and Content-Encoding. Reports the median request time and
+# the bytes sent. Request times include the database work, so the list page
+# is also rendered on its own (JSON encoding plus compression of the
+# already-serialized data), which is the part these settings change.
+
+ROUTES = [
+    ("list", "/characters/?limit={limit}"),
+    ("export", "/characters/export"),
+]
+
+
+def providers(app):
+    yield "stdlib", DefaultJSONProvider(app)
+    if orjson is not None:
+        yield "orjson", OrjsonProvider(app)
+
+
+def encodings():
+    yield "identity"
+    yield "gzip"
+    if brotli is not None:
+        yield "br"
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def timed_get(client, path, encoding, repeat):
+    headers = {} if encoding == "identity" else {"Accept-Encoding": encoding}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        times.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise click.ClickException(f"GET {path} returned {response.status_code}")
+        if response.headers.get("Content-Encoding", "identity") != encoding:
+            raise click.ClickException(f"GET {path} was not sent as {encoding}")
+    return statistics.median(times), len(body)
+
+
+@click.command("encoding")
+@click.option("--size", default=20000, show_default=True, help="Characters to seed.")
+@click.option("--repeat", default=10, show_default=True, help="Requests per combination; the median is reported.")
+def encoding(size, repeat):
+    """Compare JSON providers and gzip/brotli on the list and export endpoints."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app, _ = prepare_database(f"sqlite:///{os.path.join(tmp, 'encoding.db')}", size, 0)
+        limit = app.config["MAX_PAGE_SIZE"]
+        client = app.test_client()
+        # Warm caches and compiled statements before timing
+        for _, path in ROUTES:
+            client.get(path.format(limit=limit))
+
+        click.echo(f"{'route':8} {'json':8} {'encoding':9} {'median ms':>10} {'bytes':>12}")
+        baseline = {}
+        for name, path in ROUTES:
+            path = path.format(limit=limit)
+            for provider_name, provider in providers(app):
+                app.json = provider
+                for content_encoding in encodings():
+                    elapsed, size_bytes = timed_get(client, path, content_encoding, repeat)
+                    baseline.setdefault(name, elapsed)
+                    click.echo(
+                        f"{name:8} {provider_name:8} {content_encoding:9} {elapsed * 1000:10.1f} {size_bytes:12,}"
+                        f"  ({baseline[name] / elapsed:.2f}x)"
+                    )
+
+        path = ROUTES[0][1].format(limit=limit)
+        data = client.get(path).get_json()
+        click.echo(f"\nrendering the {len(data)}-item list page only:")
+        baseline = None
+        with app.test_request_context(path):
+            for provider_name, provider in providers(app):
+                for content_encoding in encodings():
+                    def render():
+                        body = provider.response(data).get_data()
+                        if content_encoding != "identity":
+                            body = compress_body(content_encoding, body)
+                        return body
+
+                    elapsed = timed(render, repeat * 4)
+                    baseline = baseline or elapsed
+                    click.echo(
+                        f"{'list':8} {provider_name:8} {content_encoding:9} {elapsed * 1000:10.2f} {len(render()):12,}"
+                        f"  ({baseline / elapsed:.2f}x)"
+                    )
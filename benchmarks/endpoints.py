@@ -0,0 +1,294 @@
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# HTTP benchmark of every route against freshly seeded databases of several
+# sizes, either in-process through Flask's test client or against a local
+# gunicorn. Results are written as JSON; `compare` flags regressions
+# between two result files.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+statement_count = 0
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_statement(*args):
+    global statement_count
+    statement_count += 1
+
+
+def character_payload(rnd, lookups):
+    return {
+        "name": f"Bench Pilot {rnd.randint(0, 10**9)}",
+        "birth_year": "0120-01-01",
+        "classification": "newtype",
+        "place_of_birth": "Side 3",
+        "rank": "Ensign",
+        "status": "Alive",
+        "affiliation_ids": rnd.sample(lookups["affiliations"], 2),
+        "occupation_ids": rnd.sample(lookups["occupations"], 1),
+    }
+
+
+def build_scenarios(size, lookups, seed):
+    # (name, fn(rnd) -> (method, path, json body)). Order matters: "delete"
+    # removes the characters "create" added.
+    created = []
+
+    def character_id(rnd):
+        return rnd.randint(1, size)
+
+    return [
+        ("list", lambda rnd: ("GET", "/characters/?limit=100", None)),
+        ("list_filtered", lambda rnd: ("GET", "/characters/?status=Alive&sort=-name&limit=100", None)),
+        ("get", lambda rnd: ("GET", f"/characters/{character_id(rnd)}/", None)),
+        ("search", lambda rnd: ("GET", "/characters/search?q=" + rnd.choice(["Uso", "Katejna", "Char+Azn"]), None)),
+        ("create", lambda rnd: ("POST", "/characters/", character_payload(rnd, lookups))),
+        ("put", lambda rnd: ("PUT", f"/characters/{character_id(rnd)}/", character_payload(rnd, lookups))),
+        ("patch", lambda rnd: ("PATCH", f"/characters/{character_id(rnd)}/", {"rank": "Captain"})),
+        ("delete", lambda rnd: ("DELETE", f"/characters/{created.pop()}/" if created else "/characters/0/", None)),
+        ("lookups_list", lambda rnd: ("GET", "/lookups/affiliations/", None)),
+        ("lookup_get", lambda rnd: ("GET", f"/lookups/occupations/{rnd.choice(lookups['occupations'])}/", None)),
+    ], created
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed, statements=None, peak_memory=None, errors=0):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "sql_statements_per_request": statements,
+        "peak_memory_kb": peak_memory,
+    }
+
+
+def prepare_database(database_url, size, seed, chunk_size=10000, read_url=None):
+    # Fresh schema and synthetic data for one dataset size. The replica
+    # (read_url) isn't written to; the caller fills it.
+    os.environ["DATABASE_URL"] = database_url
+    if read_url:
+        os.environ["DATABASE_READ_URL"] = read_url
+    else:
+        os.environ.pop("DATABASE_READ_URL", None)
+    from main import create_app
+    from init import db
+    from synthetic_data import seed_synthetic
+    from controllers.lookup_cache import lookup_caches
+    from models.lookup_tables import Affiliation, Occupation
+    from instrumentation import logger as request_logger
+
+    app = create_app()
+    # A JSON line per request would flood the terminal and add to the timings
+    request_logger.setLevel(logging.WARNING)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_synthetic(size, seed=seed, chunk_size=min(size, chunk_size))
+        lookups = {
+            "affiliations": list(db.session.scalars(db.select(Affiliation.id))),
+            "occupations": list(db.session.scalars(db.select(Occupation.id))),
+        }
+    for cache in lookup_caches.values():
+        cache.invalidate()
+    return app, lookups
+
+
+def run_in_process(app, scenarios, created, requests, seed):
+    global statement_count
+    client = app.test_client()
+    results = {}
+    for name, make_request in scenarios:
+        rnd = random.Random(seed)
+        latencies, errors = [], 0
+        statement_count = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            method, path, body = make_request(rnd)
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+            elif name == "create":
+                created.append(response.get_json()["id"])
+        elapsed = time.perf_counter() - started
+        statements = statement_count / requests
+
+        # Separate short pass for memory; tracemalloc would skew the timings
+        tracemalloc.start()
+        for _ in range(min(requests, 10)):
+            method, path, body = make_request(rnd)
+            response = client.open(path, method=method, json=body)
+            if name == "create" and response.status_code < 400:
+                created.append(response.get_json()["id"])
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+
+        results[name] = summarize(latencies, elapsed, statements, peak, errors)
+        click.echo(f"  {name:14} p50 {results[name]['p50_ms']:7.2f} ms  "
+                   f"p95 {results[name]['p95_ms']:7.2f} ms  {statements:5.1f} SQL/req")
+    return results
+
+
+def http_request(base_url, method, path, body):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    if data is not None:
+        request.add_header("Content-Type", "application/json")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        payload, status = e.read(), e.code
+    return time.perf_counter() - start, status, payload
+
+
+def run_gunicorn(database_url, scenarios, created, requests, seed, workers, concurrency, port):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "main:create_app()"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base_url + "/lookups/occupations/")
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.1)
+        else:
+            raise click.ClickException("gunicorn did not start")
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for name, make_request in scenarios:
+                rnd = random.Random(seed)
+                planned = [make_request(rnd) for _ in range(requests)] if name != "delete" else None
+
+                def send(index):
+                    method, path, body = planned[index] if planned else make_request(rnd)
+                    return http_request(base_url, method, path, body)
+
+                started = time.perf_counter()
+                outcomes = list(pool.map(send, range(requests)))
+                elapsed = time.perf_counter() - started
+                if name == "create":
+                    created.extend(json.loads(p)["id"] for _, status, p in outcomes if status < 400)
+                errors = sum(1 for _, status, _ in outcomes if status >= 400)
+                results[name] = summarize([latency for latency, _, _ in outcomes], elapsed, errors=errors)
+                click.echo(f"  {name:14} p50 {results[name]['p50_ms']:7.2f} ms  "
+                           f"p95 {results[name]['p95_ms']:7.2f} ms  "
+                           f"{results[name]['throughput_rps']:8.1f} req/s")
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+@click.command("http")
+@click.option("--sizes", default="1000,10000", show_default=True, help="Comma-separated dataset sizes (characters).")
+@click.option("--requests", default=200, show_default=True, help="Requests per route.")
+@click.option("--seed", default=0, show_default=True, help="Seed for the data and the request mix.")
+@click.option("--database-url", default=None,
+              help="Database to benchmark against, e.g. a local PostgreSQL. It is DROPPED and re-seeded "
+                   "for every size. Defaults to a temporary SQLite file.")
+@click.option("--gunicorn", "use_gunicorn", is_flag=True, help="Drive a local gunicorn over HTTP instead of the test client.")
+@click.option("--workers", default=2, show_default=True, help="gunicorn workers.")
+@click.option("--concurrency", default=8, show_default=True, help="Concurrent HTTP clients against gunicorn.")
+@click.option("--port", default=8765, show_default=True, help="Port for the benchmark gunicorn.")
+@click.option("--out", "out_path", default="bench_results.json", show_default=True, help="Where to write the JSON results.")
+def http(sizes, requests, seed, database_url, use_gunicorn, workers, concurrency, port, out_path):
+    """Measure throughput, latency percentiles, SQL statements and memory per route."""
+    report = {
+        "meta": {
+            "mode": "gunicorn" if use_gunicorn else "in-process",
+            "requests": requests,
+            "seed": seed,
+            "python": sys.version.split()[0],
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        url = database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        report["meta"]["database"] = url.split(":", 1)[0]
+        for size in [int(s) for s in sizes.split(",")]:
+            click.echo(f"Seeding {size} characters...")
+            app, lookups = prepare_database(url, size, seed)
+            scenarios, created = build_scenarios(size, lookups, seed)
+            click.echo(f"Dataset {size}:")
+            if use_gunicorn:
+                results = run_gunicorn(url, scenarios, created, requests, seed, workers, concurrency, port)
+            else:
+                results = run_in_process(app, scenarios, created, requests, seed)
+            report["results"][str(size)] = results
+
+    with open(out_path, "w") as f:
+        json.dump(report, f, indent=2)
+    click.echo(f"Results written to {out_path}")
+
+
+# Metrics where a higher value is worse
+COMPARED = ["p50_ms", "p95_ms", "p99_ms", "sql_statements_per_request", "peak_memory_kb"]
+
+
+@click.command("compare")
+@click.argument("baseline", type=click.File())
+@click.argument("candidate", type=click.File())
+@click.option("--threshold", default=0.10, show_default=True,
+              help="Relative change counted as a regression (0.10 = 10%).")
+def compare(baseline, candidate, threshold):
+    """Flag routes that got slower, heavier or chattier between two runs."""
+    before = json.load(baseline)["results"]
+    after = json.load(candidate)["results"]
+    sizes = sorted(set(before) & set(after), key=int)
+    if not sizes:
+        raise click.ClickException("The two runs have no dataset size in common")
+    regressions = 0
+    for size in sizes:
+        for route in sorted(set(before[size]) & set(after[size])):
+            old, new = before[size][route], after[size][route]
+            checks = [(metric, old.get(metric), new.get(metric)) for metric in COMPARED]
+            # Throughput regresses when it drops
+            checks.append(("throughput_rps", new.get("throughput_rps"), old.get("throughput_rps")))
+            for metric, reference, value in checks:
+                if reference is None or value is None:
+                    continue
+                # Statement counts are exact, so any increase counts
+                limit = reference if metric == "sql_statements_per_request" else reference * (1 + threshold)
+                if value > limit:
+                    regressions += 1
+                    shown = (new.get(metric), old.get(metric))
+                    click.echo(f"REGRESSION {size:>8} {route:14} {metric}: {shown[1]:.2f} -> {shown[0]:.2f}")
+    if regressions:
+        raise click.ClickException(f"{regressions} regression(s) above {threshold:.0%}")
+    click.echo("No regressions.")
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import click
+from sqlalchemy import event
+from benchmarks.endpoints import prepare_database
+
+# Checks that the filter and sort indexes (models/character.py,
+# models/junction_tables.py) and the change feed's seq index
+# (models/change_log.py) are used. A large SQLite dataset is seeded and
+# ANALYZEd, each request below is sent, and every SELECT it issued is run
+# again through EXPLAIN QUERY PLAN. The command fails unless one of the
+# plans names the expected index without sorting through a temporary
+# B-tree, i.e. the index serves the keyset order too.
+
+# (label, path, index that must appear in the plan)
+CHECKS = [
+    ("filter by status", "/characters/?status=Alive&limit=100", "ix_character_status_id"),
+    ("sort by name", "/characters/?sort=name&limit=100", "ix_character_name_id"),
+    ("sort by name, descending", "/characters/?sort=-name&limit=100", "ix_character_name_id"),
+    ("filter by affiliation", "/characters/?affiliation_id=1&limit=100", "ix_character_affiliation_affiliation_id"),
+    ("changes feed", "/changes?since=1000&limit=100", "ix_change_latest_seq"),
+]
+
+
+def capture_selects(engine):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", capture)
+
+
+@click.command("indexes")
+@click.option("--size", default=100000, show_default=True, help="Characters to seed.")
+def indexes(size):
+    """Check the character list's filters and sorts use their indexes."""
+    from init import db
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app, _ = prepare_database(f"sqlite:///{os.path.join(tmp, 'indexes.db')}", size, 0)
+        with app.app_context():
+            engine = db.engine
+            with engine.begin() as connection:
+                connection.exec_driver_sql("ANALYZE")
+
+        client = app.test_client()
+        for label, path, index in CHECKS:
+            statements, stop = capture_selects(engine)
+            try:
+                response = client.get(path)
+            finally:
+                stop()
+            if response.status_code != 200:
+                raise click.ClickException(f"GET {path} returned {response.status_code}")
+
+            plans = []
+            with engine.connect() as connection:
+                for statement, parameters in statements:
+                    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+                    plans.append(" | ".join(row[-1] for row in rows))
+            used = any(index in plan and "TEMP B-TREE" not in plan for plan in plans)
+            click.echo(f"{'ok' if used else 'FAIL':5} {label}: {path}")
+            for plan in plans:
+                click.echo(f"        {plan}")
+            if not used:
+                failures.append(label)
+
+        with app.app_context():
+            engine.dispose()
+
+    if failures:
+        raise click.ClickException(f"expected index not used for: {', '.join(failures)}")
+    click.echo("Every filter and sort uses its index.")
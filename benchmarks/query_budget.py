@@ -0,0 +1,163 @@
+import os
+import tempfile
+from contextlib import contextmanager
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from benchmarks.endpoints import prepare_database
+
+# Query budgets: the most SQL statements each endpoint may issue. Every
+# request runs against two seeded database sizes and, for the list, two
+# page sizes. The command fails if a budget is exceeded or if the count
+# changes with the amount of data, which is how a reintroduced N+1 (lazy
+# loads per row, per-id lookups, ...) shows up. Budgets are set to the
+# measured counts; an endpoint that comes in under its budget passes with a
+# notice to lower it, so the slack doesn't hide a later regression.
+
+SIZES = (50, 500)
+SEED = 0
+# Fixed chunk size so both datasets start with identical rows
+SEED_CHUNK = 25
+
+
+# Lookup id lists for the short/long pairs below; the seed has 50
+# affiliations and 30 occupations
+LONG_AFFILIATION_IDS = list(range(1, 41))
+LONG_OCCUPATION_IDS = list(range(1, 31))
+
+
+def bulk_items(count, affiliation_ids=(1, 2), occupation_ids=(1,), prefix="Budget"):
+    return [
+        {"name": f"{prefix} {i}", "classification": "newtype", "status": "Alive",
+         "affiliation_ids": list(affiliation_ids), "occupation_ids": list(occupation_ids)}
+        for i in range(count)
+    ]
+
+
+def character_body(affiliation_ids=(1, 2), occupation_ids=(1,)):
+    return {
+        "name": "Budget Pilot", "birth_year": "0120-01-01", "classification": "newtype",
+        "place_of_birth": "Side 3", "rank": "Ensign", "status": "Alive",
+        "affiliation_ids": list(affiliation_ids), "occupation_ids": list(occupation_ids),
+    }
+
+
+# (label, budget, method, path, body). Paths may use {page} for the list
+# page size, which is run at 10 and 100.
+BUDGETS = [
+    # First, so the filtered list below matches rows at every dataset size
+    ("bulk create", 6, "POST", "/characters/bulk", bulk_items(20)),
+    ("bulk create (long id lists)", 6, "POST", "/characters/bulk",
+     bulk_items(20, LONG_AFFILIATION_IDS, LONG_OCCUPATION_IDS, prefix="Budget long")),
+    ("list", 4, "GET", "/characters/?limit={page}", None),
+    ("list filtered+sorted", 4, "GET", "/characters/?status=Alive&affiliation_id=1&sort=-name&limit={page}", None),
+    ("list sparse (fields=id,name)", 2, "GET", "/characters/?fields=id,name&limit={page}", None),
+    ("get", 3, "GET", "/characters/1/", None),
+    ("get sparse (fields=id,name)", 1, "GET", "/characters/1/?fields=id,name", None),
+    ("batch get", 3, "GET", "/characters/batch?ids=5,1,3,2,999999", None),
+    # One GROUP BY over the rollup; lookup names come from the cache
+    ("stats", 1, "GET", "/characters/stats", None),
+    ("search", 1, "GET", "/characters/search?q=Uso&limit={page}", None),
+    ("lookups list", 0, "GET", "/lookups/affiliations/", None),
+    ("lookup get", 0, "GET", "/lookups/occupations/1/", None),
+    # Page of ids and a COUNT from the junction index, then the characters
+    ("lookup characters", 5, "GET", "/lookups/affiliations/1/characters?limit={page}", None),
+    ("lookup characters sparse", 3, "GET", "/lookups/affiliations/1/characters?fields=id,name&limit={page}", None),
+    ("create", 9, "POST", "/characters/", character_body()),
+    ("create (long id lists)", 9, "POST", "/characters/", character_body(LONG_AFFILIATION_IDS, LONG_OCCUPATION_IDS)),
+    ("put", 14, "PUT", "/characters/2/", character_body()),
+    ("patch", 10, "PATCH", "/characters/3/", {"rank": "Captain", "affiliation_ids": [2]}),
+    ("delete", 7, "DELETE", "/characters/4/", None),
+    # Past the 80 seeded lookups: a page of characters, one IN query per
+    # relationship, lookups from the cache
+    ("changes feed", 4, "GET", "/changes?since=80&limit={page}", None),
+]
+
+PAGE_SIZES = (10, 100)
+# Pairs that must issue the same number of statements: lookup ids are
+# checked with one IN query per model however many are sent
+SAME_COST = [
+    ("bulk create", "bulk create (long id lists)"),
+    ("create", "create (long id lists)"),
+]
+
+
+@contextmanager
+def count_statements():
+    counter = {"statements": 0}
+
+    def count(*args):
+        counter["statements"] += 1
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        yield counter
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+
+
+def measure(app):
+    client = app.test_client()
+    # Warm the per-process lookup cache so counts are steady-state
+    client.get("/lookups/affiliations/")
+    client.get("/lookups/occupations/")
+
+    counts = {}
+    for label, _, method, path, body in BUDGETS:
+        pages = PAGE_SIZES if "{page}" in path else (None,)
+        for page in pages:
+            url = path.format(page=page)
+            with count_statements() as counter:
+                response = client.open(url, method=method, json=body)
+            if response.status_code >= 300:
+                raise click.ClickException(f"{method} {url} failed with {response.status_code}: {response.get_data(as_text=True)}")
+            counts[(label, page)] = counter["statements"]
+    return counts
+
+
+@click.command("budgets")
+def budgets():
+    """Fail if any endpoint exceeds its SQL statement budget or scales with the data."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SIZES:
+            url = f"sqlite:///{os.path.join(tmp, f'budget_{size}.db')}"
+            app, _ = prepare_database(url, size, SEED, chunk_size=SEED_CHUNK)
+            results[size] = measure(app)
+
+    failures = 0
+    click.echo(f"{'endpoint':40} {'budget':>6} " + " ".join(f"{f'n={size}':>7}" for size in SIZES))
+    for label, budget, _, _, _ in BUDGETS:
+        for key in [k for k in results[SIZES[0]] if k[0] == label]:
+            counts = [results[size][key] for size in SIZES]
+            name = label if key[1] is None else f"{label} (limit={key[1]})"
+            problems = []
+            if max(counts) > budget:
+                problems.append("over budget")
+            if len(set(counts)) > 1:
+                problems.append("grows with data")
+            failures += bool(problems)
+            if problems:
+                status = "FAIL: " + ", ".join(problems)
+            elif max(counts) < budget:
+                status = f"ok, under budget: lower it to {max(counts)}"
+            else:
+                status = "ok"
+            click.echo(f"{name:40} {budget:>6} " + " ".join(f"{c:>7}" for c in counts) + f"  {status}")
+
+    # The same route at different page sizes must cost the same
+    for label in {key[0] for key in results[SIZES[0]] if key[1] is not None}:
+        per_page = {results[size][(label, page)] for size in SIZES for page in PAGE_SIZES}
+        if len(per_page) > 1:
+            failures += 1
+            click.echo(f"FAIL: {label} issues a different number of statements per page size: {sorted(per_page)}")
+
+    for short, long in SAME_COST:
+        counts = {results[size][(label, None)] for size in SIZES for label in (short, long)}
+        if len(counts) > 1:
+            failures += 1
+            click.echo(f"FAIL: {long} issues a different number of statements than {short}: {sorted(counts)}")
+
+    if failures:
+        raise click.ClickException(f"{failures} query budget violation(s)")
+    click.echo("All endpoints within their query budgets.")
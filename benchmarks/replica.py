@@ -0,0 +1,98 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import Counter
+import click
+from sqlalchemy import event
+from benchmarks.endpoints import prepare_database
+
+# Checks read-replica routing (read_replica.py) with two SQLite files
+# standing in for the primary and the replica. The replica is a copy of the
+# primary with one character renamed, so every response shows which
+# database it was read from.
+
+REPLICA_NAME = "Replica Copy"
+
+
+def count_by_engine(engines):
+    counts = Counter()
+    for key, engine in engines.items():
+        label = "replica" if key == "replica" else "primary"
+
+        def count(*args, label=label):
+            counts[label] += 1
+
+        event.listen(engine, "before_cursor_execute", count)
+    return counts
+
+
+@click.command("replica")
+@click.option("--size", default=50, show_default=True, help="Characters to seed.")
+def replica(size):
+    """Check GETs read from DATABASE_READ_URL and writes stay on the primary."""
+    from init import db
+    from models.character import Character
+
+    with tempfile.TemporaryDirectory() as tmp:
+        primary_path = os.path.join(tmp, "primary.db")
+        replica_path = os.path.join(tmp, "replica.db")
+        app, _ = prepare_database(
+            f"sqlite:///{primary_path}", size, 0, read_url=f"sqlite:///{replica_path}"
+        )
+        with app.app_context():
+            db.engines[None].dispose()
+            shutil.copyfile(primary_path, replica_path)
+            with sqlite3.connect(replica_path) as connection:
+                connection.execute("UPDATE character SET name = ? WHERE id = 1", (REPLICA_NAME,))
+            counts = count_by_engine(db.engines)
+
+        client = app.test_client()
+        failures = []
+
+        def check(label, ok, expected_engines):
+            used = {engine for engine, count in counts.items() if count}
+            if ok and used == expected_engines:
+                click.echo(f"ok    {label}: {dict(counts)}")
+            else:
+                failures.append(label)
+                click.echo(f"FAIL  {label}: {dict(counts)}")
+            counts.clear()
+
+        response = client.get("/characters/1/")
+        check("GET /characters/1/ reads the replica", response.json["name"] == REPLICA_NAME, {"replica"})
+
+        response = client.get("/characters/?limit=5")
+        names = [item["name"] for item in response.json]
+        check("GET /characters/ reads the replica", REPLICA_NAME in names, {"replica"})
+
+        response = client.get(f"/characters/search?q={REPLICA_NAME}")
+        check("GET /characters/search reads the replica", response.status_code == 200, {"replica"})
+
+        response = client.patch("/characters/1/", json={"rank": "Captain"})
+        check(
+            "PATCH reads and writes the primary",
+            response.status_code == 200 and response.json["name"] != REPLICA_NAME,
+            {"primary"},
+        )
+
+        # Read-after-write inside a GET request is pinned to the primary
+        with app.test_request_context("/", method="GET"):
+            before = db.session.get(Character, 1).name
+            db.session.execute(db.update(Character).filter_by(id=2).values(rank="Major"))
+            after = db.session.scalar(db.select(Character.name).filter_by(id=1))
+            db.session.rollback()
+            db.session.remove()
+        check(
+            "read after a write in the same request uses the primary",
+            before == REPLICA_NAME and after != REPLICA_NAME,
+            {"replica", "primary"},
+        )
+
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+
+    if failures:
+        raise click.ClickException(f"{len(failures)} routing check(s) failed")
+    click.echo("Replica routing behaves as expected.")
@@ -0,0 +1,99 @@
+import os
+import random
+import tempfile
+import time
+import click
+from benchmarks.endpoints import prepare_database
+from response_cache import response_cache
+
+# Response cache benchmark: a skewed read workload (most requests go to a
+# few hot characters, the lookup lists and the stats) with occasional
+# PATCHes to hot characters and lookup renames, run with the cache off and
+# on. Reports throughput, SQL-free hits, the hit ratio and the cache's
+# memory. Afterwards every route in the workload is fetched with the cache
+# on and off and the bodies compared, so a missed invalidation fails the
+# run.
+
+HOT = 20
+
+
+def workload(lookups, size, requests, write_ratio, seed):
+    rnd = random.Random(seed)
+    hot = list(range(1, HOT + 1))
+    for number in range(requests):
+        if rnd.random() < write_ratio:
+            if number % 5:
+                yield "PATCH", f"/characters/{rnd.choice(hot)}/", {"rank": f"Rank {number}"}
+            else:
+                _id = rnd.choice(lookups["affiliations"][:5])
+                yield "PATCH", f"/lookups/affiliations/{_id}/", {"name": f"Affiliation {_id} ({number})"}
+            continue
+        roll = rnd.random()
+        if roll < 0.6:
+            _id = rnd.choice(hot) if rnd.random() < 0.9 else rnd.randint(1, size)
+            yield "GET", f"/characters/{_id}/", None
+        elif roll < 0.75:
+            yield "GET", "/characters/?limit=100", None
+        elif roll < 0.85:
+            yield "GET", "/lookups/affiliations/", None
+        elif roll < 0.95:
+            yield "GET", "/characters/stats", None
+        else:
+            yield "GET", f"/characters/batch?ids={','.join(map(str, rnd.sample(hot, 5)))}", None
+
+
+def run(app, steps):
+    client = app.test_client()
+    start = time.perf_counter()
+    for method, path, body in steps:
+        response = client.open(path, method=method, json=body, headers={"Accept-Encoding": "gzip"})
+        if response.status_code != 200:
+            raise click.ClickException(f"{method} {path} returned {response.status_code}")
+    return time.perf_counter() - start
+
+
+@click.command("responsecache")
+@click.option("--size", default=20000, show_default=True, help="Characters to seed.")
+@click.option("--requests", "count", default=5000, show_default=True, help="Requests per run.")
+@click.option("--write-ratio", default=0.01, show_default=True, help="Share of requests that are writes.")
+@click.option("--seed", default=0, show_default=True, help="Workload random seed.")
+def responsecache(size, count, write_ratio, seed):
+    """Compare a skewed read/write workload with the response cache off and on."""
+    with tempfile.TemporaryDirectory() as tmp:
+        app, lookups = prepare_database(f"sqlite:///{os.path.join(tmp, 'responsecache.db')}", size, 0)
+        steps = list(workload(lookups, size, count, write_ratio, seed))
+        # Warm the lookup cache and compiled statements
+        run(app, steps[:50])
+
+        results = {}
+        for enabled in (False, True):
+            app.config["RESPONSE_CACHE_ENABLED"] = enabled
+            response_cache.backend.clear()
+            response_cache.hits = response_cache.misses = response_cache.stores = 0
+            results[enabled] = run(app, steps)
+        with app.app_context():
+            stats = response_cache.stats()
+
+        # Every cached representation must match a fresh one
+        client = app.test_client()
+        paths = sorted({path for method, path, _ in steps if method == "GET"})
+        stale = []
+        for path in paths:
+            app.config["RESPONSE_CACHE_ENABLED"] = True
+            cached = client.get(path).get_data()
+            app.config["RESPONSE_CACHE_ENABLED"] = False
+            if client.get(path).get_data() != cached:
+                stale.append(path)
+
+    click.echo(f"{'cache':8} {'seconds':>8} {'req/s':>8}")
+    for enabled, elapsed in results.items():
+        click.echo(f"{'on' if enabled else 'off':8} {elapsed:8.2f} {count / elapsed:8.0f}")
+    click.echo(f"speed-up {results[False] / results[True]:.2f}x")
+    click.echo(
+        f"hit ratio {stats['hit_ratio']:.1%} ({stats['hits']} hits, {stats['misses']} misses, "
+        f"{stats['invalidations']} invalidations)"
+    )
+    click.echo(f"memory {stats['bytes']:,} bytes in {stats['entries']} entries, {stats['evictions']} evictions")
+    if stale:
+        raise click.ClickException(f"stale cached responses: {stale}")
+    click.echo("No stale responses.")
@@ -0,0 +1,103 @@
+import json
+import random
+import time
+from datetime import date
+import click
+from models.character import Character
+from models.lookup_tables import Affiliation, Occupation
+from schemas.character_schema import characters_schema, search_results_schema, character_schema_for
+from schemas.lookup_schema import affiliations_schema, occupations_schema
+from schemas.fast_serializer import compile_serializer
+
+# Parity check and benchmark of schemas/fast_serializer.py against
+# Schema.dump(). Works on in-memory objects, so no database is needed.
+
+TEXT = ["", "Uso Ewin", "Zanscare Empire", "Ω \"quoted\" \\ back\\slash", "日本語", "line\nbreak", "x" * 300]
+
+
+def random_text(rnd, nullable=True):
+    if nullable and rnd.random() < 0.15:
+        return None
+    return rnd.choice(TEXT) + str(rnd.randint(0, 10**6))
+
+
+def random_date(rnd):
+    if rnd.random() < 0.15:
+        return None
+    return date(rnd.choice([1, 88, 140, 2024, 9999]), rnd.randint(1, 12), rnd.randint(1, 28))
+
+
+def build_characters(count, seed):
+    rnd = random.Random(seed)
+    affiliations = [Affiliation(id=i, name=random_text(rnd, nullable=False)) for i in range(1, 21)]
+    occupations = [Occupation(id=i, name=random_text(rnd, nullable=False)) for i in range(1, 11)]
+    characters = []
+    for i in range(1, count + 1):
+        characters.append(Character(
+            id=i,
+            name=random_text(rnd, nullable=False),
+            birth_year=random_date(rnd),
+            classification=random_text(rnd),
+            place_of_birth=random_text(rnd),
+            rank=random_text(rnd),
+            status=random_text(rnd),
+            affiliations=rnd.sample(affiliations, rnd.randint(0, 3)),
+            occupations=rnd.sample(occupations, rnd.randint(0, 2)),
+        ))
+    return characters, affiliations, occupations
+
+
+def encode(data):
+    # Same settings as Flask's default JSON provider
+    return json.dumps(data, sort_keys=True, ensure_ascii=True)
+
+
+def timed(fn, data, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@click.command("serializer")
+@click.option("--count", default=5000, show_default=True, help="Characters to generate.")
+@click.option("--seed", default=0, show_default=True, help="Random seed for the generated data.")
+@click.option("--repeat", default=5, show_default=True, help="Timing runs; the best is reported.")
+def serializer(count, seed, repeat):
+    """Check the fast serializer matches Schema.dump() byte for byte, then time both."""
+    characters, affiliations, occupations = build_characters(count, seed)
+    cases = [
+        ("characters", characters_schema, characters),
+        ("search results", search_results_schema, characters),
+        ("sparse fieldset", character_schema_for(("id", "name", "status", "affiliations"), many=True), characters),
+        ("affiliations", affiliations_schema, affiliations),
+        ("occupations", occupations_schema, occupations),
+    ]
+
+    failed = False
+    for label, schema, data in cases:
+        fast = compile_serializer(schema)
+        if fast is None:
+            click.echo(f"{label}: not compilable, Schema.dump() is used")
+            continue
+        expected = [encode(item) for item in schema.dump(data)]
+        actual = [encode(item) for item in fast(data)]
+        mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+        if mismatches or len(expected) != len(actual):
+            failed = True
+            click.echo(f"{label}: MISMATCH on {len(mismatches)} item(s), first at index {mismatches[:1]}")
+            continue
+
+        slow_time = timed(schema.dump, data, repeat)
+        fast_time = timed(fast, data, repeat)
+        click.echo(
+            f"{label}: {len(data)} items identical; "
+            f"marshmallow {slow_time * 1000:.1f} ms, fast {fast_time * 1000:.1f} ms "
+            f"({slow_time / fast_time:.1f}x)"
+        )
+
+    if failed:
+        raise click.ClickException("Fast serializer output differs from Schema.dump()")
@@ -0,0 +1,82 @@
+import os
+import statistics
+import tempfile
+import time
+import click
+from benchmarks.endpoints import prepare_database
+
+# Stats rollup benchmark: GET /characters/stats latency at two dataset
+# sizes, with no writes in between and straight after a write. The rollup
+# (models/character_stat.py) should make all four about the same. Then a
+# mix of writes (create, bulk, PUT, PATCH, link changes, delete, lookup
+# delete, lookup created by name) runs, and the command fails unless the
+# response matches a recount straight from the tables.
+
+REPEAT = 20
+
+
+def timed_get(client, path):
+    start = time.perf_counter()
+    response = client.get(path)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 200:
+        raise click.ClickException(f"GET {path} returned {response.status_code}")
+    return elapsed, response.get_json()
+
+
+def write_mix(client, lookups):
+    affiliations = lookups["affiliations"]
+    body = {"name": "Stats Pilot", "classification": "newtype", "status": "Alive", "rank": "Ensign"}
+    steps = [
+        ("POST", "/characters/", {**body, "affiliation_ids": affiliations[:2], "occupation_ids": [1]}),
+        ("POST", "/characters/bulk", [
+            {**body, "name": f"Stats Bulk {i}", "rank": None if i % 2 else "Major",
+             "affiliation_ids": affiliations[i % 3:i % 3 + 2]}
+            for i in range(30)
+        ]),
+        ("PUT", "/characters/1/", {**body, "classification": "oldtype", "affiliation_ids": affiliations[3:5]}),
+        ("PATCH", "/characters/2/", {"status": "Killed In Action", "add_affiliation_ids": [affiliations[6]]}),
+        ("PATCH", "/characters/3/", {"rank": "Captain", "remove_occupation_ids": [1, 2, 3]}),
+        ("PATCH", "/characters/4/", {"affiliation_names": ["Stats Brand New Affiliation"]}),
+        ("DELETE", "/characters/5/", None),
+        ("DELETE", f"/lookups/affiliations/{affiliations[0]}/", None),
+    ]
+    for method, path, json in steps:
+        response = client.open(path, method=method, json=json)
+        if response.status_code >= 300 and response.status_code != 207:
+            raise click.ClickException(f"{method} {path} returned {response.status_code}: {response.get_data(as_text=True)}")
+
+
+@click.command("stats")
+@click.option("--sizes", default="1000,100000", show_default=True, help="Comma-separated dataset sizes.")
+def stats(sizes):
+    """Time GET /characters/stats before and after writes and check it against a recount."""
+    from init import db
+    from controllers.character_stats import build_stats, count_directly
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(part) for part in sizes.split(",")]:
+            app, lookups = prepare_database(f"sqlite:///{os.path.join(tmp, f'stats_{size}.db')}", size, 0)
+            client = app.test_client()
+            timed_get(client, "/characters/stats")
+            idle = statistics.median(timed_get(client, "/characters/stats")[0] for _ in range(REPEAT))
+            after_write = []
+            for number in range(REPEAT):
+                client.patch(f"/characters/{number + 1}/", json={"rank": f"Rank {number}"})
+                after_write.append(timed_get(client, "/characters/stats")[0])
+            results.append((size, idle, statistics.median(after_write)))
+
+            write_mix(client, lookups)
+            _, served = timed_get(client, "/characters/stats")
+            with app.test_request_context():
+                # The same response built from a full GROUP BY of the tables
+                expected = build_stats(count_directly())
+                db.session.remove()
+            if served != expected:
+                raise click.ClickException(f"stats rollup drifted from the tables at n={size}")
+
+    click.echo(f"{'characters':>10} {'idle ms':>8} {'after write ms':>15}")
+    for size, idle, after_write in results:
+        click.echo(f"{size:>10} {idle * 1000:>8.2f} {after_write * 1000:>15.2f}")
+    click.echo("Rollup matches a recount of the tables.")
@@ -3,6 +3,13 @@ from flask import Blueprint
 from init import db
 from models.character import Character
 from models.lookup_tables import Affiliation, Occupation
+from models.search_index import create_search_index
+from models.character_stat import rebuild_stats_rollup
+from synthetic_data import seed_synthetic
+from data_transfer import import_file, export_file
+from controllers.lookup_cache import bump_version, lookup_caches
+from controllers.changes import record_changes
+from response_cache import invalidate_stale
 import click
 
 db_commands = Blueprint("db", __name__)
@@ -26,8 +33,66 @@ def drop_db():
         raise click.ClickException(f"Failed to drop tables: {e}")
 
 
+@db_commands.cli.command("search-index")
+def create_search_index_cmd():
+    # `create` sets the index up for new tables; this adds it to an existing
+    # database (and re-indexes existing rows on SQLite)
+    try:
+        with db.engine.begin() as connection:
+            create_search_index(connection)
+        print("Search index created.")
+    except Exception as e:
+        raise click.ClickException(f"Failed to create search index: {e}")
+
+
+@db_commands.cli.command("stats-rollup")
+def rebuild_stats_rollup_cmd():
+    # `create` sets the rollup up when it creates its table; this recounts
+    # it from the current rows, e.g. after writes made with triggers off
+    try:
+        with db.engine.begin() as connection:
+            rebuild_stats_rollup(connection)
+        print("Stats rollup recounted.")
+    except Exception as e:
+        raise click.ClickException(f"Failed to recount stats rollup: {e}")
+
+
 @db_commands.cli.command("seed")
-def seed_db():
+@click.option("--count", type=int, default=None,
+              help="Generate this many synthetic characters instead of the Victory Gundam sample.")
+@click.option("--affiliations", type=int, default=50, show_default=True,
+              help="Synthetic affiliations to generate.")
+@click.option("--occupations", type=int, default=30, show_default=True,
+              help="Synthetic occupations to generate.")
+@click.option("--affiliation-fanout", default="0:0.2,1:0.5,2:0.2,3:0.1", show_default=True,
+              help="Affiliations per character as count:weight pairs.")
+@click.option("--occupation-fanout", default="0:0.1,1:0.7,2:0.2", show_default=True,
+              help="Occupations per character as count:weight pairs.")
+@click.option("--seed", "random_seed", type=int, default=0, show_default=True,
+              help="Random seed; the same seed always generates the same data.")
+@click.option("--chunk-size", type=int, default=10000, show_default=True,
+              help="Rows written and committed per batch.")
+def seed_db(count, affiliations, occupations, affiliation_fanout, occupation_fanout, random_seed, chunk_size):
+    if count is not None:
+        def progress(done, total, elapsed):
+            print(f"{done}/{total} characters ({done / max(elapsed, 1e-9):,.0f} rows/s)")
+
+        try:
+            seed_synthetic(
+                count,
+                affiliations=affiliations,
+                occupations=occupations,
+                affiliation_fanout=affiliation_fanout,
+                occupation_fanout=occupation_fanout,
+                seed=random_seed,
+                chunk_size=chunk_size,
+                progress=progress,
+            )
+            print(f"Database seeded with {count} synthetic characters.")
+        except Exception as e:
+            raise click.ClickException(f"Failed to seed database: {e}")
+        return
+
     try:
         # Characters from Mobile Suit Victory Gundam, UC 0153 era
         characters = [
@@ -143,9 +208,66 @@ def seed_db():
 
         # Add all characters and lookups to session (relationships handled automatically)
         db.session.add_all(characters + list(affiliations.values()) + list(occupations.values()))
+        for rows in (characters, list(affiliations.values()), list(occupations.values())):
+            record_changes(rows[0].__tablename__, [row.id for row in rows])
+        for name in [cache.name for cache in lookup_caches.values()]:
+            bump_version(name)
         db.session.commit()
+        invalidate_stale(db.session)
 
         print("Database seeded with Victory Gundam characters, affiliations, and occupations.")
     except Exception as e:
         # Convert unexpected errors into clickable errors for the terminal
         raise click.ClickException(f"Failed to seed database: {e}")
+
+
+@db_commands.cli.command("import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default=None,
+              help="File format; by default taken from the extension (.ndjson, .jsonl, .csv).")
+@click.option("--chunk-size", type=int, default=1000, show_default=True,
+              help="Records validated, written and committed per batch.")
+@click.option("--upsert", is_flag=True,
+              help="Update the character with the same name instead of adding another one.")
+@click.option("--restart", is_flag=True,
+              help="Discard the checkpoint of an earlier, interrupted run and start from the beginning.")
+@click.option("--errors", type=click.Path(dir_okay=False), default=None,
+              help="Write the rejected records' numbers and validation errors to this NDJSON file.")
+def import_db(path, fmt, chunk_size, upsert, restart, errors):
+    # Characters from an NDJSON or CSV file, e.g. one written by `export`.
+    # Interrupted imports resume from their checkpoint when run again.
+    def progress(state, done, elapsed):
+        print(
+            f"{state['records']} records: {state['created']} created, {state['updated']} updated, "
+            f"{state['failed']} failed ({done / max(elapsed, 1e-9):,.0f} records/s)"
+        )
+
+    try:
+        state = import_file(
+            path, fmt=fmt, chunk_size=chunk_size, upsert=upsert, restart=restart,
+            errors=errors, progress=progress,
+        )
+    except Exception as e:
+        raise click.ClickException(f"Failed to import {path}: {e}")
+    print(
+        f"Imported {path}: {state['created']} created, {state['updated']} updated, "
+        f"{state['failed']} failed."
+    )
+
+
+@db_commands.cli.command("export")
+@click.argument("path", type=click.Path(dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default=None,
+              help="File format; by default taken from the extension (.ndjson, .jsonl, .csv).")
+@click.option("--chunk-size", type=int, default=1000, show_default=True,
+              help="Characters read and written per batch.")
+def export_db(path, fmt, chunk_size):
+    # Every character with its lookups by name, in a format `import` reads back
+    def progress(count, elapsed):
+        print(f"{count} characters ({count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    try:
+        count = export_file(path, fmt=fmt, chunk_size=chunk_size, progress=progress)
+    except Exception as e:
+        raise click.ClickException(f"Failed to export to {path}: {e}")
+    print(f"Exported {count} characters to {path}.")
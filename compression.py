@@ -0,0 +1,100 @@
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding: brotli when the
+# package is installed and the client accepts it, otherwise gzip. Bodies
+# below COMPRESSION_MIN_SIZE are sent as they are, since the headers and
+# CPU cost more than they save. Streamed responses (exports) are compressed
+# chunk by chunk and flushed after every chunk, so they keep streaming.
+#
+# A compressed body is a different representation, so its strong ETag gets
+# the encoding as a suffix ("<etag>-gzip"). not_modified_or_none() in
+# controllers/helpers.py accepts either form through etag_variants().
+
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "text/plain", "text/html"}
+SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+
+def negotiate():
+    # Returns the encoding to use for this request, or None
+    if not current_app.config["COMPRESSION_ENABLED"]:
+        return None
+    accepted = request.accept_encodings
+    if brotli is not None and accepted.quality("br") > 0:
+        return "br"
+    if accepted.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def etag_variants(etag):
+    # The ETags a client may hold for this representation
+    encoding = negotiate()
+    return (etag,) if encoding is None else (etag, etag + SUFFIXES[encoding])
+
+
+def compressor(encoding):
+    # Returns (compress, flush, finish) functions for one body
+    if encoding == "br":
+        stream = brotli.Compressor(quality=current_app.config["COMPRESSION_BROTLI_QUALITY"])
+        return stream.process, stream.flush, stream.finish
+    stream = zlib.compressobj(current_app.config["COMPRESSION_GZIP_LEVEL"], zlib.DEFLATED, 31)
+    return stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), stream.flush
+
+
+def compress_body(encoding, data):
+    compress, _, finish = compressor(encoding)
+    return compress(data) + finish()
+
+
+def compress_stream(chunks, codec, close):
+    # Flushes after every chunk so the client gets data as it's produced.
+    # The codec is built beforehand; this runs after the request has ended.
+    compress, flush, finish = codec
+    try:
+        for chunk in chunks:
+            data = compress(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if close is not None:
+            close()
+
+
+def compress_response(response):
+    if response.mimetype not in COMPRESSIBLE or response.direct_passthrough:
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.status_code < 200 or response.status_code in (204, 304) or "Content-Encoding" in response.headers:
+        return response
+    encoding = negotiate()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        original = response.response
+        response.response = compress_stream(
+            response.iter_encoded(), compressor(encoding), getattr(original, "close", None)
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config["COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(compress_body(encoding, data))
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag is not None:
+        response.set_etag(etag + SUFFIXES[encoding], weak)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -1,6 +1,49 @@
 import os
 
 class Config(object):
+    # Keyset pagination for list endpoints
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+    SEARCH_PAGE_SIZE = 10
+    # Rows fetched and serialized per round-trip when streaming exports
+    EXPORT_CHUNK_SIZE = 500
+    # Largest batch accepted by POST /characters/bulk
+    MAX_BULK_ITEMS = 5000
+    # Per-process cache of the affiliation/occupation tables. After the TTL
+    # (seconds) a worker re-checks the shared version row; None never expires.
+    LOOKUP_CACHE_ENABLED = True
+    LOOKUP_CACHE_TTL = 30
+    # PostgreSQL: fold the stats rollup's pending deltas into it once a
+    # GET /characters/stats sees more than this many (models/character_stat.py)
+    STATS_COMPACT_AFTER = 1000
+    # Serve read endpoints through schemas/fast_serializer.py instead of
+    # Schema.dump(); output is identical (python -m benchmarks serializer)
+    FAST_SERIALIZER = True
+    # Per-request SQL count/timings: Server-Timing header, JSON log lines on
+    # the "gundam_api.requests" logger and histograms at /metrics
+    INSTRUMENTATION_ENABLED = True
+    # Emit those JSON lines on stderr at INFO. Turn off to leave the
+    # logger's level and handlers to the deployment's own logging config.
+    REQUEST_LOG_ENABLED = True
+    # Encode JSON with orjson when it is installed (json_provider.py)
+    FAST_JSON = True
+    # gzip/brotli responses per Accept-Encoding (compression.py). Smaller
+    # bodies aren't worth compressing; brotli quality 4 suits dynamic content.
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_QUALITY = 4
+    # Server-side cache of GET responses (response_cache.py), off by default.
+    # Entries are dropped by the writes that affect them in this worker;
+    # other workers see changes after the TTL (seconds). The backend is the
+    # in-process LRU unless a "module:Class" ResponseCacheBackend is named.
+    RESPONSE_CACHE_ENABLED = False
+    RESPONSE_CACHE_BACKEND = None
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL = 30
+    # Store gzip/brotli variants with each entry so hits skip compression
+    RESPONSE_CACHE_PRECOMPRESS = True
+
     @property
     def SQLALCHEMY_DATABASE_URI(self):
         # access to .env and get the value of DATABASE_URL, the variable name can be any but needs to match
@@ -9,6 +52,48 @@ class Config(object):
             raise ValueError("DATABASE_URL is not set")
         return value
 
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        return engine_options(os.environ.get("DATABASE_URL", ""))
+
+    @property
+    def SQLALCHEMY_BINDS(self):
+        # Optional read replica. GET/HEAD requests read from it; writes and
+        # anything after a write in the same request go to the primary
+        # (see read_replica.py). Without it everything uses DATABASE_URL.
+        value = os.environ.get("DATABASE_READ_URL")
+        if not value:
+            return {}
+        return {"replica": {"url": value, **engine_options(value)}}
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, "") else int(value)
+
+
+def engine_options(url):
+    # Connection pool settings, shared by the primary and the replica:
+    #   DB_POOL_SIZE       connections kept open per worker process
+    #   DB_MAX_OVERFLOW    extra connections allowed under bursts
+    #   DB_POOL_TIMEOUT    seconds to wait for a free connection
+    #   DB_POOL_RECYCLE    seconds before a connection is replaced, to stay
+    #                      under server/proxy idle timeouts
+    #   DB_POOL_PRE_PING   test connections on checkout, dropping dead ones
+    options = {
+        "pool_recycle": env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes"),
+    }
+    # SQLite connections are local files; its pools (a static pool for
+    # in-memory databases) don't take sizing options
+    if not url.startswith("sqlite"):
+        options.update(
+            pool_size=env_int("DB_POOL_SIZE", 5),
+            max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=env_int("DB_POOL_TIMEOUT", 30),
+        )
+    return options
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
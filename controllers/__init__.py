@@ -1,4 +1,5 @@
 from controllers.character_controller import characters
 from controllers.lookup_controller import lookups
+from controllers.change_controller import changes
 
-registerable_controllers = [characters, lookups]
\ No newline at end of file
+registerable_controllers = [characters, lookups, changes]
\ No newline at end of file
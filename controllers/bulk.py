@@ -0,0 +1,185 @@
+from flask import request, abort, current_app
+from marshmallow import ValidationError
+from init import db
+from models.character import Character
+from models.lookup_tables import Affiliation, Occupation
+from models.junction_tables import character_affiliation, character_occupation
+from models.timestamps import utcnow
+from schemas.character_schema import CharacterSchema
+from controllers.helpers import existing_ids, link_changes, sync_links, resolve_link_names
+from controllers.changes import CHARACTER, record_changes
+
+# Bulk writes for characters. Everything here works on whole batches: one
+# validation pass, one IN query per lookup model, multi-row INSERT/UPDATE
+# statements and a single transaction (committed by the caller).
+
+CHARACTER_COLUMNS = ["name", "birth_year", "classification", "place_of_birth", "rank", "status"]
+REQUIRED_COLUMNS = [
+    column.name
+    for column in Character.__table__.columns
+    if not column.nullable and not column.primary_key and column.default is None
+]
+
+# (schema field, lookup model, junction table, junction column)
+LINKS = [
+    ("affiliation_ids", Affiliation, character_affiliation, "affiliation_id"),
+    ("occupation_ids", Occupation, character_occupation, "occupation_id"),
+]
+
+bulk_schema = CharacterSchema(many=True)
+
+
+def get_bulk_items_or_abort():
+    # Accept either a JSON array or an NDJSON body (one object per line)
+    if request.mimetype == "application/x-ndjson":
+        items = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(current_app.json.loads(line))
+            except ValueError:
+                abort(400, description=f"Invalid JSON on line {number}")
+    else:
+        items = request.get_json()
+        if not isinstance(items, list):
+            abort(400, description="Expected a JSON array of characters")
+
+    maximum = current_app.config["MAX_BULK_ITEMS"]
+    if len(items) > maximum:
+        abort(400, description=f"At most {maximum} characters can be sent in one request")
+    return items
+
+
+def validate_bulk_items(items):
+    # Returns (loaded, errors): loaded maps index -> loaded fields for the
+    # items that passed, errors maps index -> messages for those that didn't
+    errors = {}
+    try:
+        loaded_list = bulk_schema.load(items, session=db.session)
+    except ValidationError as e:
+        errors = {index: messages for index, messages in e.messages.items()}
+        loaded_list = e.valid_data or [None] * len(items)
+
+    loaded = {}
+    for index, fields in enumerate(loaded_list):
+        if index in errors or not isinstance(fields, dict):
+            errors.setdefault(index, {"_schema": ["Invalid input type."]})
+            continue
+        loaded[index] = fields
+    return loaded, errors
+
+
+def bulk_write_characters(items, upsert=False):
+    # Returns one result dict per input item, in input order
+    loaded, errors = validate_bulk_items(items)
+
+    # Resolve every referenced lookup id with one query per model
+    for field, model, _, _ in LINKS:
+        def linked(fields):
+            return fields.get(field, []) + fields.get(f"add_{field}", [])
+
+        wanted = {_id for fields in loaded.values() for _id in linked(fields)}
+        found = existing_ids(model, wanted)
+        for index, fields in list(loaded.items()):
+            missing = [_id for _id in linked(fields) if _id not in found]
+            if missing:
+                errors[index] = {field: [f"{model.__name__} id(s) not found: {missing}"]}
+                del loaded[index]
+
+    # In upsert mode, items whose name matches exactly one existing character update it
+    existing_by_name = {}
+    if upsert:
+        names = {fields["name"] for fields in loaded.values() if "name" in fields}
+        if names:
+            rows = db.session.execute(
+                db.select(Character.id, Character.name).where(Character.name.in_(names))
+            )
+            for _id, name in rows:
+                existing_by_name.setdefault(name, []).append(_id)
+
+    inserts = []
+    updates = []
+    seen_names = set()
+    for index, fields in loaded.items():
+        name = fields.get("name")
+        # Nameless items fall through to the required-column check below
+        if upsert and name is not None:
+            if name in seen_names:
+                errors[index] = {"name": ["Duplicate name in request"]}
+                continue
+            seen_names.add(name)
+
+        matches = existing_by_name.get(name, [])
+        if len(matches) > 1:
+            errors[index] = {"name": [f"Name matches several characters: {matches}"]}
+        elif matches:
+            updates.append((index, matches[0], fields))
+        else:
+            missing = [column for column in REQUIRED_COLUMNS if fields.get(column) is None]
+            if missing:
+                errors[index] = {column: ["Missing data for required field."] for column in missing}
+            else:
+                inserts.append((index, fields))
+
+    # Lookups named instead of referenced by id, resolved once per batch.
+    # Only items that passed every check get here, so one that fails never
+    # leaves a newly created lookup behind in the committed batch.
+    resolve_link_names([fields for _, fields in inserts] + [fields for _, _, fields in updates])
+
+    ids = {}
+    if inserts:
+        rows = [{column: fields.get(column) for column in CHARACTER_COLUMNS} for _, fields in inserts]
+        # PostgreSQL hands RETURNING rows back in parameter order from
+        # batched multi-row INSERTs. SQLite can't promise that (SQLAlchemy
+        # would fall back to one INSERT per row), but its writes are
+        # serialized and rowids are assigned in insertion order, so sorting
+        # the ids restores the input order.
+        ordered = db.session.get_bind().dialect.name != "sqlite"
+        # render_nulls: the ORM otherwise leaves None columns out and starts
+        # a new INSERT whenever the set of null columns changes between rows
+        new_ids = db.session.scalars(
+            db.insert(Character).returning(Character.id, sort_by_parameter_order=ordered),
+            rows,
+            execution_options={"render_nulls": True},
+        ).all()
+        if not ordered:
+            new_ids.sort()
+        for (index, _), _id in zip(inserts, new_ids):
+            ids[index] = _id
+
+    if updates:
+        rows = [
+            {
+                "id": _id,
+                "updated_at": utcnow(),
+                **{column: fields[column] for column in CHARACTER_COLUMNS if column in fields},
+            }
+            for _, _id, fields in updates
+        ]
+        db.session.execute(db.update(Character), rows)
+        for index, _id, _ in updates:
+            ids[index] = _id
+
+    # Junction rows: only the links that differ from what's stored are
+    # deleted or inserted; new characters have none yet
+    new_ids = {ids[index] for index, _ in inserts}
+    for field, _, junction, column in LINKS:
+        changes = {}
+        for index in ids:
+            change = link_changes(loaded[index], field)
+            if change is not None:
+                changes[ids[index]] = change
+        if changes:
+            sync_links(junction, column, changes, new_ids=new_ids)
+    record_changes(CHARACTER, ids.values())
+
+    updated = {index for index, _, _ in updates}
+    results = []
+    for index in range(len(items)):
+        if index in errors:
+            results.append({"index": index, "status": "error", "errors": errors[index]})
+        else:
+            status = "updated" if index in updated else "created"
+            results.append({"index": index, "status": status, "id": ids[index]})
+    return results
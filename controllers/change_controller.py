@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, current_app
+from schemas.character_schema import character_schema
+from schemas.lookup_schema import affiliation_schema
+from controllers.helpers import get_int_arg_or_abort, next_page_link, serialize
+from controllers.changes import CHARACTER, DELETE, latest_changes, current_rows
+
+changes = Blueprint("changes", __name__, url_prefix="/changes")
+
+
+@changes.route("/", methods=["GET"], strict_slashes=False)
+def get_changes():
+    # Incremental sync: ?since=<cursor from the previous response>&limit=<n>.
+    # Each entry is the latest change of one character, affiliation or
+    # occupation, with its current data, or a tombstone (op "delete", data
+    # null). Keep "cursor" and pass it as ?since= next time; "has_more"
+    # says whether to ask again straight away.
+    since = get_int_arg_or_abort("since", default=0, minimum=0)
+    limit = get_int_arg_or_abort(
+        "limit",
+        default=current_app.config["PAGE_SIZE"],
+        minimum=1,
+        maximum=current_app.config["MAX_PAGE_SIZE"],
+    )
+
+    page = latest_changes(since, limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
+    rows = current_rows(page)
+
+    result = []
+    for change in page:
+        row = rows.get((change.entity, change.entity_id))
+        entry = {
+            "seq": change.seq,
+            "entity": change.entity,
+            "id": change.entity_id,
+            "op": change.op,
+            "changed_at": change.changed_at.isoformat() + "Z",
+            "data": None,
+        }
+        if row is not None and change.op != DELETE:
+            schema = character_schema if change.entity == CHARACTER else affiliation_schema
+            entry["data"] = serialize(schema, row)
+        elif change.op != DELETE:
+            # Deleted by a transaction whose tombstone isn't visible yet
+            entry["op"] = DELETE
+        result.append(entry)
+
+    cursor = page[-1].seq if page else since
+    headers = {"Link": next_page_link(since=cursor)} if has_more else {}
+    return jsonify({"changes": result, "cursor": cursor, "has_more": has_more}), 200, headers
@@ -0,0 +1,103 @@
+from sqlalchemy.orm import selectinload
+from init import db
+from models.change_log import FEED_HORIZON_SQL, ChangeLatest, ChangeLog, has_change_latest
+from models.character import Character
+from models.lookup_tables import Affiliation, Occupation
+from models.timestamps import utcnow
+from read_replica import use_primary
+from response_cache import mark_stale
+
+# Change feed: write paths record what they touched in change_log, in their
+# own transaction, and GET /changes reads it back from a cursor. A consumer
+# that keeps the last cursor only ever reads what changed since, so its
+# sync cost follows the write rate instead of the size of the catalogue.
+#
+# Link changes are recorded as upserts of the character (its representation
+# embeds the links), and so are renames and deletes of a lookup for every
+# character linked to it.
+
+UPSERT = "upsert"
+DELETE = "delete"
+CHARACTER = Character.__tablename__
+# entity name -> model
+ENTITIES = {model.__tablename__: model for model in (Character, Affiliation, Occupation)}
+
+
+def record_changes(entity, ids, op=UPSERT):
+    # One multi-row INSERT for any number of ids
+    now = utcnow()
+    rows = [{"entity": entity, "entity_id": _id, "op": op, "changed_at": now} for _id in dict.fromkeys(ids)]
+    if rows:
+        db.session.execute(db.insert(ChangeLog), rows)
+        # Cached responses built from these rows, and every list of them
+        mark_stale(db.session, [entity, *(f"{entity}:{row['entity_id']}" for row in rows)])
+
+
+def record_change(entity, id_, op=UPSERT):
+    record_changes(entity, [id_], op)
+
+
+def record_linked_changes(junction, column, id_):
+    # Every character linked to a lookup, with one INSERT ... SELECT
+    linked = db.select(
+        db.literal(CHARACTER),
+        junction.c.character_id,
+        db.literal(UPSERT),
+        db.literal(utcnow(), db.DateTime),
+    ).where(junction.c[column] == id_)
+    stmt = db.insert(ChangeLog).from_select(["entity", "entity_id", "op", "changed_at"], linked)
+    db.session.execute(stmt)
+    # Single cached characters are tagged with the lookups they embed, and
+    # the lookup records its own change; lists of characters embed it too
+    mark_stale(db.session, [CHARACTER])
+
+
+def latest_changes(since, limit):
+    # The latest change of each entity changed after `since`, oldest first.
+    # An entity changed several times shows up once, at its last seq, so a
+    # consumer that is far behind doesn't replay every intermediate state.
+    dialect = db.session.get_bind().dialect.name
+    if has_change_latest(dialect):
+        # Kept by a trigger on change_log: a range scan of its seq index
+        stmt = db.select(ChangeLatest).where(ChangeLatest.seq > since).order_by(ChangeLatest.seq).limit(limit)
+        if dialect == "postgresql":
+            # Stop below any seq that may still commit, so a cursor never
+            # passes a change it hasn't seen. The horizon comes from the
+            # primary's locks, so the page is read there too.
+            use_primary(db.session)
+            handed_out, held = db.session.execute(db.text(FEED_HORIZON_SQL)).one()
+            horizon = handed_out if held is None else min(handed_out, held)
+            stmt = stmt.where(ChangeLatest.seq <= horizon)
+        return db.session.scalars(stmt).all()
+
+    # Backends without the trigger group the log itself
+    latest = (
+        db.select(db.func.max(ChangeLog.seq).label("seq"))
+        .where(ChangeLog.seq > since)
+        .group_by(ChangeLog.entity, ChangeLog.entity_id)
+        .order_by(db.func.max(ChangeLog.seq))
+        .limit(limit)
+        .subquery()
+    )
+    stmt = db.select(ChangeLog).join(latest, ChangeLog.seq == latest.c.seq).order_by(ChangeLog.seq)
+    return db.session.scalars(stmt).all()
+
+
+def current_rows(changes):
+    # {(entity, id): row} for the entities whose latest change is an
+    # upsert, with one IN query per model (plus one per relationship for
+    # characters). Lookups are read from the database too: a worker's
+    # lookup cache may not have caught up with the changes on the page yet.
+    wanted = {}
+    for change in changes:
+        if change.op == UPSERT:
+            wanted.setdefault(change.entity, []).append(change.entity_id)
+
+    rows = {}
+    for entity, ids in wanted.items():
+        model = ENTITIES[entity]
+        stmt = db.select(model).where(model.id.in_(ids))
+        if model is Character:
+            stmt = stmt.options(selectinload(Character.affiliations), selectinload(Character.occupations))
+        rows.update(((entity, row.id), row) for row in db.session.scalars(stmt))
+    return rows
@@ -1,46 +1,264 @@
-from flask import Blueprint, jsonify, request, abort
+from flask import Blueprint, Response, jsonify, request, abort, current_app, stream_with_context
+from marshmallow import ValidationError
 from init import db
 from models.character import Character
-from schemas.character_schema import character_schema, CharacterSchema
+from schemas.character_schema import character_schema, search_results_schema, character_schema_for
 from models.lookup_tables import Affiliation, Occupation
+from models.timestamps import utcnow
 from controllers.helpers import (
     load_schema_or_abort,
     validate_ids_exist_or_abort,
     commit_or_abort,
     get_json_or_empty,
-    fetch_or_abort,
+    get_int_arg_or_abort,
+    get_id_list_arg_or_abort,
+    next_page_link,
+    make_etag,
+    not_modified_or_none,
+    with_validators,
+    serialize,
+    check_ids_exist_or_abort,
+    link_changes,
+    sync_links,
+    resolve_link_names,
+)
+from controllers.bulk import LINKS, REQUIRED_COLUMNS, get_bulk_items_or_abort, bulk_write_characters
+from controllers.character_stats import get_stats
+from controllers.changes import CHARACTER, DELETE, record_change
+from response_cache import cached, tag
+from controllers.character_queries import (
+    apply_character_filters,
+    apply_sort_and_cursor,
+    get_sort_or_abort,
+    encode_cursor,
+    decode_cursor_or_abort,
+    search_characters_stmt,
+    get_fieldset_or_abort,
+    fieldset_options,
 )
 
 characters = Blueprint("characters", __name__, url_prefix="/characters")
 
 
+def require_columns_or_abort(fields):
+    # Creating or replacing a character needs every non-nullable column
+    missing = [column for column in REQUIRED_COLUMNS if fields.get(column) is None]
+    if missing:
+        raise ValidationError({column: ["Missing data for required field."] for column in missing})
+
+
+def update_links_or_abort(character, fields):
+    # Applies affiliation_ids/occupation_ids (the complete list) and the
+    # add_*/remove_* variants as set differences. Returns True if any link
+    # changed.
+    changed = False
+    for field, model, junction, column in LINKS:
+        change = link_changes(fields, field)
+        if change is None:
+            continue
+        replace, add, _ = change
+        check_ids_exist_or_abort(model, (replace or []) + add, model.__name__)
+        if sync_links(junction, column, {character.id: change}):
+            changed = True
+    if changed:
+        # The collections were changed behind the ORM's back
+        db.session.expire(character, ["affiliations", "occupations"])
+    return changed
+
+
+def embedded_lookup_tags(items):
+    # Response cache tags for the lookups dumped characters embed, so a
+    # rename drops them
+    for item in items:
+        for field, model in (("affiliations", Affiliation), ("occupations", Occupation)):
+            for lookup in item.get(field, ()):
+                yield f"{model.__tablename__}:{lookup['id']}"
+
+
 @characters.route("/", methods=["GET"])
+@cached(CHARACTER)
 def get_characters():
-    # get all the characters from the database table
-    characters_list = Character.query.all()
-    # Convert the characters from the database into a JSON format and store them in result
-    result = CharacterSchema(many=True).dump(characters_list)
-    # return the data in JSON format
-    return jsonify(result), 200
+    # Keyset pagination: ?limit=<n>&after=<cursor of the last row seen>,
+    # combined with ?sort=, the column/link filters and sparse fieldsets
+    only = get_fieldset_or_abort()
+    limit = get_int_arg_or_abort(
+        "limit",
+        default=current_app.config["PAGE_SIZE"],
+        minimum=1,
+        maximum=current_app.config["MAX_PAGE_SIZE"],
+    )
+    sort, descending = get_sort_or_abort()
+    cursor = decode_cursor_or_abort(sort)
+
+    # First pass reads only ids, timestamps and the sort key: they decide
+    # the ETag, so a client whose copy is current gets a 304 before
+    # anything else is loaded
+    columns = [Character.id, Character.updated_at]
+    if sort != "id":
+        columns.append(getattr(Character, sort))
+    stmt = db.select(*columns).limit(limit + 1)
+    stmt = apply_character_filters(stmt)
+    stmt = apply_sort_and_cursor(stmt, sort, descending, cursor)
+    page = db.session.execute(stmt).all()
+
+    etag = make_etag("characters", request.query_string, [tuple(row) for row in page])
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+
+    # One extra row tells us whether there is a next page
+    headers = {}
+    ids = [row.id for row in page]
+    if len(ids) > limit:
+        ids = ids[:limit]
+        headers["Link"] = next_page_link(after=encode_cursor(sort, page[limit - 1]))
+
+    # Included relationships are loaded with one IN query each for the
+    # whole page instead of lazy loads per character
+    characters_list = []
+    if ids:
+        stmt = db.select(Character).options(*fieldset_options(only)).where(Character.id.in_(ids))
+        by_id = {character.id: character for character in db.session.scalars(stmt)}
+        characters_list = [by_id[_id] for _id in ids if _id in by_id]
+
+    result = serialize(character_schema_for(only, many=True), characters_list)
+    return with_validators(jsonify(result), etag), 200, headers
+
+
+@characters.route("/search", methods=["GET"])
+@cached(CHARACTER)
+def search_characters():
+    # Typeahead: ?q=<text>, paginated with ?limit= and ?offset=
+    q = request.args.get("q", "").strip()
+    if not q:
+        abort(400, description="q is required")
+    limit = get_int_arg_or_abort(
+        "limit",
+        default=current_app.config["SEARCH_PAGE_SIZE"],
+        minimum=1,
+        maximum=current_app.config["MAX_PAGE_SIZE"],
+    )
+    offset = get_int_arg_or_abort("offset", default=0, minimum=0)
+
+    stmt = search_characters_stmt(q).limit(limit + 1).offset(offset)
+    rows = db.session.execute(stmt).all()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["Link"] = next_page_link(offset=offset + limit)
+    return jsonify(serialize(search_results_schema, rows)), 200, headers
+
+
+@characters.route("/batch", methods=["GET"])
+@cached()
+def get_characters_batch():
+    # Several characters by id in one request: ?ids=3,1,2 (plus the sparse
+    # fieldset parameters). Found characters come back in the order asked
+    # for; ids that don't exist are listed under "missing".
+    only = get_fieldset_or_abort()
+    ids = get_id_list_arg_or_abort("ids", maximum=current_app.config["MAX_PAGE_SIZE"])
+
+    # One query for the rows, one IN query per included relationship
+    stmt = db.select(Character).options(*fieldset_options(only)).where(Character.id.in_(ids))
+    by_id = {character.id: character for character in db.session.scalars(stmt)}
+    found = [by_id[_id] for _id in ids if _id in by_id]
+    missing = [_id for _id in ids if _id not in by_id]
+
+    etag = make_etag("batch", only, [(c.id, c.updated_at) for c in found], missing)
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+    result = {"characters": serialize(character_schema_for(only, many=True), found), "missing": missing}
+    # Missing ids too: a character created later may take one of them
+    tag(*(f"{CHARACTER}:{_id}" for _id in ids), *embedded_lookup_tags(result["characters"]))
+    return with_validators(jsonify(result), etag), 200
+
+
+@characters.route("/stats", methods=["GET"])
+@cached(CHARACTER, "affiliation", "occupation")
+def get_character_stats():
+    # Character counts per classification, status, rank, affiliation and
+    # occupation, from the trigger-maintained rollup
+    stats = get_stats()
+    etag = make_etag("stats", stats)
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+    return with_validators(jsonify(stats), etag), 200
+
+
+@characters.route("/export", methods=["GET"])
+def export_characters():
+    # Stream the whole catalogue as NDJSON (default) or as a JSON array
+    fmt = request.args.get("format")
+    if fmt is None:
+        fmt = "json" if request.accept_mimetypes.best == "application/json" else "ndjson"
+    if fmt not in ("ndjson", "json"):
+        abort(400, description="format must be 'ndjson' or 'json'")
+    only = get_fieldset_or_abort()
+    schema = character_schema_for(only, many=True)
+
+    chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+    # yield_per streams rows (server-side cursor on PostgreSQL) and lets
+    # selectinload fetch the included relationships once per chunk
+    stmt = (
+        db.select(Character)
+        .options(*fieldset_options(only))
+        .order_by(Character.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    def generate():
+        dumps = current_app.json.dumps
+        first = True
+        if fmt == "json":
+            yield "["
+        for chunk in db.session.scalars(stmt).partitions():
+            lines = [dumps(item) for item in serialize(schema, chunk)]
+            if fmt == "ndjson":
+                yield "\n".join(lines) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(lines)
+            first = False
+        if fmt == "json":
+            yield "]"
+
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
 
 @characters.route("/<int:id>/", methods=["GET"])
+@cached(f"{CHARACTER}:{{id}}")
 def get_character(id):
-    # get a single character from the database
-    character = fetch_or_abort(Character, id, not_found_message="Character doesn't exist")
-    result = character_schema.dump(character)
-    return jsonify(result), 200
+    # get a single character from the database, limited to ?fields= etc.
+    only = get_fieldset_or_abort()
+    stmt = db.select(Character).options(*fieldset_options(only, relationships=False)).filter_by(id=id)
+    character = db.session.scalar(stmt)
+    if character is None:
+        abort(404, description="Character doesn't exist")
+    # Answer revalidations before the relationships are loaded or dumped
+    etag = make_etag("character", character.id, character.updated_at, only)
+    not_modified = not_modified_or_none(etag, character.updated_at)
+    if not_modified:
+        return not_modified
+    result = serialize(character_schema_for(only), character)
+    tag(*embedded_lookup_tags([result]))
+    return with_validators(jsonify(result), etag, character.updated_at), 200
 
 @characters.route("/", methods=["POST"])
 def create_character():
     # Create a new character
     data = request.get_json()
     character_fields = load_schema_or_abort(character_schema, data=data, session=db.session)
+    resolve_link_names([character_fields])
+    require_columns_or_abort(character_fields)
     new_character = Character(
         name=character_fields["name"],
-        birth_year=character_fields["birth_year"],
+        birth_year=character_fields.get("birth_year"),
         classification=character_fields["classification"],
-        place_of_birth=character_fields["place_of_birth"],
-        rank=character_fields["rank"],
+        place_of_birth=character_fields.get("place_of_birth"),
+        rank=character_fields.get("rank"),
         status=character_fields["status"]
     )
     
@@ -58,11 +276,35 @@ def create_character():
         for occupation in occs:
             new_character.occupations.append(occupation)
     
+    db.session.flush()
+    record_change(CHARACTER, new_character.id)
     commit_or_abort()
 
     return jsonify(character_schema.dump(new_character)), 201
 
 
+@characters.route("/bulk", methods=["POST"])
+def bulk_create_characters():
+    # Create many characters in one transaction; ?upsert=name updates
+    # characters whose name already exists instead of adding duplicates
+    upsert = request.args.get("upsert")
+    if upsert not in (None, "name"):
+        abort(400, description="upsert must be 'name'")
+    items = get_bulk_items_or_abort()
+
+    results = bulk_write_characters(items, upsert=upsert == "name")
+    commit_or_abort()
+
+    failed = sum(1 for result in results if result["status"] == "error")
+    report = {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "updated": sum(1 for result in results if result["status"] == "updated"),
+        "failed": failed,
+        "results": results,
+    }
+    return jsonify(report), 207 if failed else 201
+
+
 @characters.route("/<int:id>/", methods=["PUT"])
 def update_character(id):
     stmt = db.select(Character).filter_by(id=id)
@@ -72,28 +314,22 @@ def update_character(id):
     
     data = get_json_or_empty()
     character_fields = load_schema_or_abort(character_schema, data=data, session=db.session, partial=False)
+    resolve_link_names([character_fields])
     
+    require_columns_or_abort(character_fields)
     character.name = character_fields["name"]
-    character.birth_year = character_fields["birth_year"]
+    character.birth_year = character_fields.get("birth_year")
     character.classification = character_fields["classification"]
-    character.place_of_birth = character_fields["place_of_birth"]
-    character.rank = character_fields["rank"]
+    character.place_of_birth = character_fields.get("place_of_birth")
+    character.rank = character_fields.get("rank")
     character.status = character_fields["status"]
     
-    # Handle affiliations
-    if "affiliation_ids" in character_fields:
-        character.affiliations.clear()
-        affs = validate_ids_exist_or_abort(Affiliation, character_fields["affiliation_ids"], "Affiliation")
-        for affiliation in affs:
-            character.affiliations.append(affiliation)
-    
-    # Handle occupations
-    if "occupation_ids" in character_fields:
-        character.occupations.clear()
-        occs = validate_ids_exist_or_abort(Occupation, character_fields["occupation_ids"], "Occupation")
-        for occupation in occs:
-            character.occupations.append(occupation)
+    # Links: only the ones that changed are deleted or inserted
+    if update_links_or_abort(character, character_fields):
+        # Link changes don't touch the character row, so bump it explicitly
+        character.updated_at = utcnow()
     
+    record_change(CHARACTER, character.id)
     commit_or_abort()
 
     return jsonify(character_schema.dump(character)), 200
@@ -109,6 +345,7 @@ def patch_character(id):
     
     data = get_json_or_empty()
     character_fields = load_schema_or_abort(character_schema, data=data, session=db.session, partial=True)
+    resolve_link_names([character_fields])
     
     if "name" in character_fields:
         character.name = character_fields["name"]
@@ -123,20 +360,12 @@ def patch_character(id):
     if "status" in character_fields:
         character.status = character_fields["status"]
     
-    # Handle affiliations
-    if "affiliation_ids" in character_fields:
-        character.affiliations.clear()
-        affs = validate_ids_exist_or_abort(Affiliation, character_fields["affiliation_ids"], "Affiliation")
-        for affiliation in affs:
-            character.affiliations.append(affiliation)
-    
-    # Handle occupations
-    if "occupation_ids" in character_fields:
-        character.occupations.clear()
-        occs = validate_ids_exist_or_abort(Occupation, character_fields["occupation_ids"], "Occupation")
-        for occupation in occs:
-            character.occupations.append(occupation)
+    # Links: only the ones that changed are deleted or inserted
+    if update_links_or_abort(character, character_fields):
+        # Link changes don't touch the character row, so bump it explicitly
+        character.updated_at = utcnow()
     
+    record_change(CHARACTER, character.id)
     commit_or_abort()
 
     return jsonify(character_schema.dump(character)), 200
@@ -152,6 +381,7 @@ def delete_character(id):
         return abort(400, description="Character doesn't exist")
     
     db.session.delete(character)
+    record_change(CHARACTER, id, DELETE)
     commit_or_abort()
 
     return jsonify({"success": "character deleted"}), 200
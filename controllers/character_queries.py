@@ -0,0 +1,214 @@
+import base64
+import itertools
+import json
+from datetime import date
+from flask import request, abort
+from sqlalchemy.orm import load_only, selectinload
+from init import db
+from models.character import Character
+from models.junction_tables import character_affiliation, character_occupation
+from controllers.helpers import get_int_arg_or_abort
+
+# Query-string driven filtering, sorting and keyset cursors for the
+# character list. Every filter and sort key below is backed by an index in
+# models/character.py or models/junction_tables.py.
+
+FILTER_COLUMNS = ["classification", "status", "rank", "place_of_birth"]
+LINK_FILTERS = {
+    "affiliation_id": (character_affiliation, "affiliation_id"),
+    "occupation_id": (character_occupation, "occupation_id"),
+}
+SORT_COLUMNS = ["id", "name", "birth_year", "classification", "status", "rank", "place_of_birth"]
+# Sparse fieldsets: what ?fields=, ?include= and ?exclude= can name, in the
+# order CharacterSchema dumps them
+SCALAR_FIELDS = ["id", "name", "birth_year", "classification", "place_of_birth", "rank", "status"]
+RELATIONSHIP_FIELDS = ["affiliations", "occupations"]
+ALL_FIELDS = SCALAR_FIELDS + RELATIONSHIP_FIELDS
+
+
+def apply_character_filters(stmt):
+    for name in FILTER_COLUMNS:
+        value = request.args.get(name)
+        if value is not None:
+            stmt = stmt.where(getattr(Character, name) == value)
+    for name, (junction, column) in LINK_FILTERS.items():
+        value = get_int_arg_or_abort(name)
+        if value is not None:
+            linked = db.select(junction.c.character_id).where(junction.c[column] == value)
+            stmt = stmt.where(Character.id.in_(linked))
+    return stmt
+
+
+def get_sort_or_abort():
+    # ?sort=<column> ascending, ?sort=-<column> descending; defaults to id
+    raw = request.args.get("sort", "id")
+    descending = raw.startswith("-")
+    name = raw.lstrip("-")
+    if name not in SORT_COLUMNS:
+        abort(400, description=f"sort must be one of {SORT_COLUMNS}, optionally prefixed with '-'")
+    return name, descending
+
+
+def encode_cursor(sort, row):
+    # Sorting by id keeps plain integer cursors; other sorts need the sort
+    # value too, packed into an opaque token
+    if sort == "id":
+        return row.id
+    value = getattr(row, sort)
+    if isinstance(value, date):
+        value = value.isoformat()
+    token = json.dumps([value, row.id]).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor_or_abort(sort):
+    raw = request.args.get("after")
+    if raw is None or raw == "":
+        return None
+    if sort == "id":
+        return None, get_int_arg_or_abort("after")
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+        if value is not None and sort == "birth_year":
+            value = date.fromisoformat(value)
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        abort(400, description="after is not a valid cursor for this sort")
+
+
+def apply_sort_and_cursor(stmt, sort, descending, cursor):
+    # Keyset pagination on (sort column, id). NULLs sort last ascending and
+    # first descending, which is PostgreSQL's default so its btree indexes
+    # can be scanned in either direction.
+    column = getattr(Character, sort)
+    if sort == "id":
+        order = [Character.id.desc() if descending else Character.id]
+    elif descending:
+        order = [column.desc().nulls_first(), Character.id.desc()]
+    else:
+        order = [column.asc().nulls_last(), Character.id]
+    stmt = stmt.order_by(*order)
+
+    if cursor is None:
+        return stmt
+    value, last_id = cursor
+    if sort == "id":
+        return stmt.where(Character.id < last_id if descending else Character.id > last_id)
+
+    pair = db.tuple_(column, Character.id)
+    if descending:
+        if value is None:
+            condition = db.or_(db.and_(column.is_(None), Character.id < last_id), column.is_not(None))
+        else:
+            condition = pair < (value, last_id)
+    else:
+        if value is None:
+            condition = db.and_(column.is_(None), Character.id > last_id)
+        else:
+            condition = pair > (value, last_id)
+            if Character.__table__.c[sort].nullable:
+                condition = db.or_(condition, column.is_(None))
+    return stmt.where(condition)
+
+
+def like_prefix(q):
+    # q as a LIKE prefix pattern (with escape="\\"), its own % and _
+    # matched literally
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
+
+def search_characters_stmt(q):
+    # Ranked fuzzy name matches, best first. Both backends score by shared
+    # trigrams, so small typos ("Katejna") still find the character.
+    dialect = db.session.get_bind().dialect.name
+    columns = [Character.id, Character.name]
+    if dialect == "postgresql":
+        # "<%" is pg_trgm word similarity; it and the prefix ILIKE both use
+        # the GIN trigram index
+        score = db.func.word_similarity(q, Character.name)
+        return (
+            db.select(*columns)
+            .where(
+                db.or_(
+                    db.literal(q).op("<%")(Character.name),
+                    Character.name.ilike(like_prefix(q), escape="\\"),
+                )
+            )
+            .order_by(score.desc(), Character.id)
+        )
+    if dialect == "sqlite" and len(q) >= 3:
+        # OR of the query's trigrams against the FTS5 trigram table; bm25
+        # ranks names sharing more trigrams first
+        grams = dict.fromkeys(q[i:i + 3].lower() for i in range(len(q) - 2))
+        match = " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+        fts = db.table("character_fts", db.column("rowid"), db.column("rank"))
+        return (
+            db.select(*columns)
+            .join(fts, fts.c.rowid == Character.id)
+            .where(db.text("character_fts MATCH :match").bindparams(match=match))
+            .order_by(fts.c.rank, Character.id)
+        )
+    if dialect == "sqlite":
+        # Too short for trigrams: one name prefix range per upper/lower-case
+        # spelling of the query ("us" -> "US", "Us", "uS", "us"). It matches
+        # as case-insensitively as ILIKE does on PostgreSQL and is still
+        # answered from the name index, either as range searches or as a
+        # walk in name order that stops at the page limit.
+        spellings = sorted({"".join(chars) for chars in itertools.product(*({c.lower(), c.upper()} for c in q))})
+        condition = db.or_(
+            *(db.and_(Character.name >= spelling, Character.name < spelling + "\uffff") for spelling in spellings)
+        )
+    else:
+        condition = Character.name.ilike(like_prefix(q), escape="\\")
+    return db.select(*columns).where(condition).order_by(Character.name, Character.id)
+
+
+def split_arg_or_abort(name, allowed):
+    # Comma-separated names from ?<name>=, or None when it isn't given
+    if name not in request.args:
+        return None
+    names = {part.strip() for part in request.args[name].split(",") if part.strip()}
+    unknown = sorted(names - set(allowed))
+    if unknown:
+        abort(400, description=f"Unknown {name}: {', '.join(unknown)}. Allowed: {allowed}")
+    return names
+
+
+def get_fieldset_or_abort():
+    # ?fields= picks the fields to return, ?include= the relationships to
+    # embed (all of them by default) and ?exclude= drops fields. Returns the
+    # selected names in schema order, or None for the full representation.
+    fields = split_arg_or_abort("fields", ALL_FIELDS)
+    include = split_arg_or_abort("include", RELATIONSHIP_FIELDS)
+    exclude = split_arg_or_abort("exclude", ALL_FIELDS)
+    if fields is None and include is None and exclude is None:
+        return None
+
+    if fields is None:
+        selected = set(SCALAR_FIELDS) | (set(RELATIONSHIP_FIELDS) if include is None else include)
+    else:
+        selected = fields | (include or set())
+    selected -= exclude or set()
+    if not selected:
+        abort(400, description="No fields selected")
+    only = tuple(name for name in ALL_FIELDS if name in selected)
+    return None if only == tuple(ALL_FIELDS) else only
+
+
+def fieldset_options(only, relationships=True):
+    # Loader options that fetch just what the fieldset dumps: the selected
+    # columns (plus updated_at for validators) and, with relationships=True,
+    # one IN query per included relationship. Relationships left out are
+    # never loaded since nothing touches them.
+    names = ALL_FIELDS if only is None else only
+    options = []
+    if only is not None:
+        columns = [getattr(Character, name) for name in names if name in SCALAR_FIELDS]
+        options.append(load_only(Character.updated_at, *columns))
+    if relationships:
+        options.extend(
+            selectinload(getattr(Character, name)) for name in names if name in RELATIONSHIP_FIELDS
+        )
+    return options
@@ -0,0 +1,110 @@
+from flask import current_app
+from sqlalchemy.orm import Session
+from init import db
+from models.character_stat import (
+    COLUMN_DIMENSIONS,
+    LINK_DIMENSIONS,
+    CharacterStat,
+    CharacterStatDelta,
+    compact_stats,
+    count_statement,
+    has_stats_rollup,
+)
+from models.lookup_tables import Affiliation, Occupation
+from controllers.lookup_cache import lookup_caches
+
+# GET /characters/stats reads the trigger-maintained rollup in
+# models/character_stat.py: one GROUP BY over a table with a row per
+# distinct value (plus, on PostgreSQL, the deltas not folded in yet), so a
+# request costs the same whatever the number of characters. Writes don't
+# touch any shared row for it, and nothing is recomputed after them.
+
+LINK_MODELS = {"affiliation": Affiliation, "occupation": Occupation}
+
+
+def read_rollup():
+    # [(dimension, value, missing, count)] and the number of pending deltas
+    rows = db.union_all(
+        db.select(
+            CharacterStat.dimension,
+            CharacterStat.value,
+            CharacterStat.missing,
+            CharacterStat.count.label("count"),
+            db.literal(0).label("pending"),
+        ),
+        db.select(
+            CharacterStatDelta.dimension,
+            CharacterStatDelta.value,
+            CharacterStatDelta.missing,
+            CharacterStatDelta.delta,
+            db.literal(1),
+        ),
+    ).subquery()
+    stmt = db.select(
+        rows.c.dimension,
+        rows.c.value,
+        rows.c.missing,
+        db.func.sum(rows.c.count),
+        db.func.sum(rows.c.pending),
+    ).group_by(rows.c.dimension, rows.c.value, rows.c.missing)
+    counts = []
+    pending = 0
+    for dimension, value, missing, count, waiting in db.session.execute(stmt):
+        pending += waiting
+        counts.append((dimension, None if missing else value, count))
+    return counts, pending
+
+
+def count_directly():
+    # The same counts straight from the tables, for backends without the
+    # rollup triggers
+    return [
+        (dimension, None if missing else value, count)
+        for dimension, value, missing, count in db.session.execute(count_statement())
+    ]
+
+
+def lookup_names(model):
+    cache = lookup_caches[model]
+    rows = cache.all()
+    if rows is None:
+        rows = db.session.execute(db.select(model.id, model.name))
+    return {row.id: row.name for row in rows}
+
+
+def get_stats():
+    if has_stats_rollup(db.session.get_bind().dialect.name):
+        counts, pending = read_rollup()
+        if pending > current_app.config["STATS_COMPACT_AFTER"]:
+            # Straight on the primary, in its own transaction
+            with Session(db.engine) as session, session.begin():
+                compact_stats(session.connection())
+    else:
+        counts = count_directly()
+    return build_stats(counts)
+
+
+def build_stats(counts):
+    # The response body from (dimension, value, count) rows
+    stats = {"total": 0}
+    stats.update({dimension: [] for dimension in COLUMN_DIMENSIONS + list(LINK_DIMENSIONS)})
+    names = {}
+    for dimension, value, count in counts:
+        if count <= 0:
+            continue
+        if dimension == "total":
+            stats["total"] = count
+        elif dimension in LINK_DIMENSIONS:
+            model = LINK_MODELS[dimension]
+            if model not in names:
+                names[model] = lookup_names(model)
+            name = names[model].get(int(value))
+            if name is not None:
+                stats[dimension].append({"id": int(value), "name": name, "count": count})
+        else:
+            stats[dimension].append({"value": value, "count": count})
+    # Largest groups first; ties in a stable order
+    for dimension in stats:
+        if dimension != "total":
+            stats[dimension].sort(key=lambda item: (-item["count"], item.get("id", 0), item.get("value") or ""))
+    return stats
@@ -1,11 +1,31 @@
-from flask import request, abort
+import hashlib
+from collections import defaultdict
+from datetime import timezone
+from flask import Response, request, abort, url_for, current_app
 from init import db
 from marshmallow import ValidationError
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from controllers.lookup_cache import lookup_caches, bump_version
+from controllers.changes import record_changes, record_linked_changes
+from models.character import Character
+from models.lookup_tables import Affiliation, Occupation
+from models.timestamps import utcnow
+from schemas.fast_serializer import fast_dump
+from instrumentation import track
+from compression import etag_variants
+from response_cache import invalidate_stale
 
 # To keep the controllers DRY, this helpers file contains common functions
 # that are used in multiple controllers.
 
+# (schema field with names, schema field with ids, lookup model)
+LINK_NAME_FIELDS = [
+    ("affiliation_names", "affiliation_ids", Affiliation),
+    ("occupation_names", "occupation_ids", Occupation),
+]
+
 def get_json_or_empty():
     data = request.get_json()
     return data if data is not None else {}
@@ -13,8 +33,10 @@ def get_json_or_empty():
 
 def load_schema_or_abort(schema, data=None, session=None, partial=False):
     payload = data if data is not None else request.get_json()
+    # Plain marshmallow schemas (LookupSchema) don't accept a session
+    kwargs = {"session": session} if session is not None else {}
     try:
-        return schema.load(payload, session=session, partial=partial)
+        return schema.load(payload, partial=partial, **kwargs)
     except ValidationError as e:
         # Keep behavior consistent with existing controllers
         abort(400, description={"errors": e.messages})
@@ -29,17 +51,255 @@ def fetch_or_abort(model, id_, not_found_message=None, http_code=404):
 
 
 def validate_ids_exist_or_abort(model, ids, name="Resource"):
-    instances = []
-    missing = []
-    for _id in ids:
-        inst = db.session.get(model, _id)
-        if not inst:
-            missing.append(_id)
-        else:
-            instances.append(inst)
+    # Resolve all ids with a single IN query; duplicates are dropped and the
+    # instances come back in the order the ids were submitted. Cached
+    # lookups aren't loaded again, but the query still confirms they exist,
+    # since another worker's delete only reaches this cache after its TTL.
+    unique_ids = list(dict.fromkeys(ids))
+    cache = lookup_caches.get(model)
+    found = cache.resolve_ids(unique_ids) if cache else {}
+    if found:
+        confirmed = existing_ids(model, unique_ids)
+        found = {_id: obj for _id, obj in found.items() if _id in confirmed}
+        remaining = [_id for _id in unique_ids if _id in confirmed and _id not in found]
+    else:
+        remaining = unique_ids
+    if remaining:
+        stmt = db.select(model).where(model.id.in_(remaining))
+        found.update({inst.id: inst for inst in db.session.scalars(stmt)})
+    missing = [_id for _id in unique_ids if _id not in found]
+    if missing:
+        abort(404, description=f"{name} id(s) not found: {missing}")
+    return [found[_id] for _id in unique_ids]
+
+
+def check_ids_exist_or_abort(model, ids, name="Resource"):
+    # Like validate_ids_exist_or_abort, for callers that only need to know
+    # the ids exist; nothing is loaded into the session
+    unique_ids = list(dict.fromkeys(ids))
+    found = existing_ids(model, unique_ids)
+    missing = [_id for _id in unique_ids if _id not in found]
     if missing:
         abort(404, description=f"{name} id(s) not found: {missing}")
-    return instances
+
+
+def get_or_create_lookup_ids(model, names):
+    # Returns {name: id} for every name, creating missing lookups. Known
+    # names come from the cache, the rest from one IN query; the ones still
+    # missing are inserted with a single INSERT ... ON CONFLICT DO NOTHING
+    # and selected again, which also picks up rows a concurrent request
+    # created first. Runs in the caller's transaction.
+    cache = lookup_caches[model]
+    names = list(dict.fromkeys(names))
+    ids = {}
+    for name in names:
+        cached = cache.get_by_name(name)
+        if cached is not None:
+            ids[name] = cached.id
+
+    def select_missing():
+        missing = [name for name in names if name not in ids]
+        if missing:
+            stmt = db.select(model.name, model.id).where(model.name.in_(missing))
+            ids.update(db.session.execute(stmt).all())
+        return [name for name in names if name not in ids]
+
+    missing = select_missing()
+    if missing:
+        dialect = db.session.get_bind().dialect.name
+        rows = [{"name": name, "updated_at": utcnow()} for name in missing]
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            db.session.execute(insert(model).values(rows).on_conflict_do_nothing(index_elements=["name"]))
+        else:
+            # No portable ON CONFLICT: one savepoint per row instead
+            for row in rows:
+                try:
+                    with db.session.begin_nested():
+                        db.session.execute(db.insert(model).values(row))
+                except IntegrityError:
+                    pass
+        select_missing()
+        record_changes(cache.name, [ids[name] for name in missing])
+        bump_version(cache.name)
+        # This worker's copy is dropped once the transaction commits (see
+        # commit_or_abort); until then misses fall back to SQL
+        db.session.info.setdefault("stale_lookup_caches", set()).add(cache)
+    return ids
+
+
+def resolve_link_names(items):
+    # affiliation_names/occupation_names -> ids merged into affiliation_ids/
+    # occupation_ids, for a list of loaded inputs at once: one lookup
+    # resolution per model however many items name it
+    for names_field, ids_field, model in LINK_NAME_FIELDS:
+        named = [fields for fields in items if names_field in fields]
+        if not named:
+            continue
+        ids = get_or_create_lookup_ids(model, [name for fields in named for name in fields[names_field]])
+        for fields in named:
+            linked = [ids[name] for name in fields.pop(names_field)]
+            fields[ids_field] = list(dict.fromkeys(fields.get(ids_field, []) + linked))
+
+
+def link_changes(fields, field):
+    # (replace, add, remove) for e.g. field="affiliation_ids", or None when
+    # the input doesn't touch those links. replace is the complete list of
+    # linked ids, or None to start from the current links.
+    replace = fields.get(field)
+    add = fields.get(f"add_{field}", [])
+    remove = fields.get(f"remove_{field}", [])
+    if replace is None and not add and not remove:
+        return None
+    return replace, add, remove
+
+
+def sync_links(junction, column, changes, new_ids=()):
+    # Set-difference update of a junction table for many characters at once.
+    # changes maps character id -> (replace, add, remove) from link_changes();
+    # removals win over additions. Only links that actually change are
+    # deleted or inserted, with one statement each, so resending the same
+    # list writes nothing. Characters in new_ids are known to have no links
+    # yet. Returns the ids of the characters whose links changed.
+    current = defaultdict(set)
+    known = [_id for _id in changes if _id not in new_ids]
+    if known:
+        stmt = db.select(junction.c.character_id, junction.c[column]).where(junction.c.character_id.in_(known))
+        for character_id, linked_id in db.session.execute(stmt):
+            current[character_id].add(linked_id)
+
+    deletes = []
+    inserts = []
+    for character_id, (replace, add, remove) in changes.items():
+        have = current[character_id]
+        want = set(have if replace is None else replace)
+        want.update(add)
+        want.difference_update(remove)
+        deletes.extend((character_id, linked_id) for linked_id in sorted(have - want))
+        inserts.extend({"character_id": character_id, column: linked_id} for linked_id in sorted(want - have))
+
+    if deletes:
+        pairs = tuple_(junction.c.character_id, junction.c[column])
+        db.session.execute(junction.delete().where(pairs.in_(deletes)))
+    if inserts:
+        db.session.execute(junction.insert(), inserts)
+    return {character_id for character_id, _ in deletes} | {row["character_id"] for row in inserts}
+
+
+def commit_lookup_change(model):
+    # Commit a lookup write together with its cache version bump, then drop
+    # this worker's cached copy so the next read reloads it
+    cache = lookup_caches[model]
+    bump_version(cache.name)
+    commit_or_abort()
+    cache.invalidate()
+
+
+def get_int_arg_or_abort(name, default=None, minimum=None, maximum=None):
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        abort(400, description=f"{name} must be an integer")
+    if minimum is not None and value < minimum:
+        abort(400, description=f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        abort(400, description=f"{name} must be at most {maximum}")
+    return value
+
+
+def get_id_list_arg_or_abort(name, maximum):
+    # ?<name>=3,1,2 -> [3, 1, 2]: unique ids in the order given
+    raw = request.args.get(name, "")
+    try:
+        ids = [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        abort(400, description=f"{name} must be a comma-separated list of integers")
+    if not ids:
+        abort(400, description=f"{name} is required")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > maximum:
+        abort(400, description=f"{name} accepts at most {maximum} ids")
+    return ids
+
+
+def next_page_link(**params):
+    # Build the URL of the next page from the current request, keeping the
+    # other query parameters (filters, limit, ...) the client sent
+    args = request.args.to_dict()
+    args.update(params)
+    url = url_for(request.endpoint, _external=True, **(request.view_args or {}), **args)
+    return f'<{url}>; rel="next"'
+
+
+def existing_ids(model, ids):
+    # One IN query returning the subset of ids that exist for the model.
+    # Writes check against the database rather than the lookup cache: a
+    # lookup deleted by another worker would otherwise pass here and fail
+    # on the foreign key at commit.
+    ids = set(ids)
+    if not ids:
+        return set()
+    stmt = db.select(model.id).where(model.id.in_(ids))
+    # Lookup rows don't depend on what the caller has pending
+    with db.session.no_autoflush:
+        return set(db.session.scalars(stmt))
+
+
+def serialize(schema, data):
+    # Read endpoints dump through the precompiled serializer when enabled;
+    # its output is identical to schema.dump()
+    with track("serialize"):
+        if current_app.config["FAST_SERIALIZER"]:
+            return fast_dump(schema, data)
+        return schema.dump(data)
+
+
+def make_etag(*parts):
+    # Strong validator derived from whatever identifies the representation
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def not_modified_or_none(etag, last_modified=None):
+    # Returns a 304 response when the client's cached copy is still current.
+    # If-None-Match takes precedence over If-Modified-Since and uses the
+    # weak comparison, so W/"..." tags match too (RFC 9110).
+    if request.if_none_match:
+        # The client may hold the compressed variant ("<etag>-gzip")
+        matched = [tag for tag in etag_variants(etag) if request.if_none_match.contains_weak(tag)]
+        fresh = bool(matched)
+        if fresh:
+            etag = matched[0]
+    elif last_modified is not None and request.if_modified_since is not None:
+        modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+        fresh = modified <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return with_validators(Response(status=304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    return response
+
+
+def touch_linked_characters(junction, column, id_):
+    # A lookup rename or delete changes every character that embeds it
+    record_linked_changes(junction, column, id_)
+    linked = db.select(junction.c.character_id).where(junction.c[column] == id_)
+    stmt = (
+        db.update(Character)
+        .where(Character.id.in_(linked))
+        .values(updated_at=utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(stmt)
 
 
 def commit_or_abort():
@@ -47,4 +307,10 @@ def commit_or_abort():
         db.session.commit()
     except SQLAlchemyError as e:
         db.session.rollback()
+        db.session.info.pop("stale_lookup_caches", None)
+        invalidate_stale(db.session, committed=False)
         abort(500, description=f"Database error: {e}")
+    # Lookups created along the way (affiliation_names etc.)
+    for cache in db.session.info.pop("stale_lookup_caches", ()):
+        cache.invalidate()
+    invalidate_stale(db.session)
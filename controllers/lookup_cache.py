@@ -0,0 +1,158 @@
+import threading
+import time
+from flask import current_app
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from init import db
+from models.cache_version import CacheVersion
+from models.lookup_tables import Affiliation, Occupation
+
+# Per-process cache of the lookup tables. The tables are tiny and rarely
+# written, so each worker keeps a full copy (by id and by name) and serves
+# the /lookups GET endpoints from it without any SQL. Character writes link
+# the cached instances instead of loading them, after one IN query has
+# confirmed the ids still exist.
+#
+# Writes in this process invalidate the copy straight away. Other workers
+# notice through the cache_version row: once LOOKUP_CACHE_TTL seconds have
+# passed they read the version (a single-row SELECT) and reload the table
+# only if it changed.
+
+
+def get_version(session, name):
+    stmt = db.select(CacheVersion.version).filter_by(name=name)
+    return session.scalar(stmt) or 0
+
+
+def bump_version(name):
+    # Runs inside the caller's transaction so the bump commits with the change
+    stmt = (
+        db.update(CacheVersion)
+        .filter_by(name=name)
+        .values(version=CacheVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if db.session.execute(stmt).rowcount == 0:
+        db.session.add(CacheVersion(name=name, version=1))
+
+
+class LookupCache:
+    def __init__(self, model):
+        self.model = model
+        self.name = model.__tablename__
+        self.by_id = None
+        self.by_name = None
+        self.version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return current_app.config["LOOKUP_CACHE_ENABLED"]
+
+    def _is_fresh(self):
+        if self.by_id is None:
+            return False
+        ttl = current_app.config["LOOKUP_CACHE_TTL"]
+        return ttl is None or time.monotonic() - self.checked_at < ttl
+
+    def _load(self):
+        # Returns (by_id, by_name), reloading first when the copy is missing
+        # or its TTL ran out and the shared version moved on. The dicts are
+        # returned rather than read back from self so a concurrent
+        # invalidate() can't pull them away mid-request.
+        by_id, by_name = self.by_id, self.by_name
+        if by_id is not None and self._is_fresh():
+            return by_id, by_name
+        with self.lock:
+            if self.by_id is not None and self._is_fresh():
+                return self.by_id, self.by_name
+            # A separate session so the cached instances end up detached
+            # and never interfere with the request's identity map
+            with Session(db.engine) as session:
+                version = get_version(session, self.name)
+                if self.by_id is None or version != self.version:
+                    rows = session.scalars(db.select(self.model).order_by(self.model.id)).all()
+                    self.by_id = {row.id: row for row in rows}
+                    self.by_name = {row.name: row for row in rows}
+                    self.version = version
+                    self.reloads += 1
+            self.checked_at = time.monotonic()
+            return self.by_id, self.by_name
+
+    def _count(self, obj):
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return obj
+
+    def invalidate(self):
+        with self.lock:
+            self.by_id = None
+            self.by_name = None
+
+    def warm(self):
+        # Loads the table ahead of the first request (worker boot)
+        if self.enabled:
+            self._load()
+
+    def all(self):
+        # Every row ordered by id, or None when the cache is disabled
+        if not self.enabled:
+            return None
+        by_id, _ = self._load()
+        self.hits += 1
+        return list(by_id.values())
+
+    def get(self, id_):
+        if not self.enabled:
+            return None
+        by_id, _ = self._load()
+        return self._count(by_id.get(id_))
+
+    def get_by_name(self, name):
+        if not self.enabled:
+            return None
+        _, by_name = self._load()
+        return self._count(by_name.get(name))
+
+    def resolve_ids(self, ids):
+        # Returns {id: instance} for the cached ids, attached to the request
+        # session with merge(load=False) so they can be used in relationships
+        # without being SELECTed again. Ids not found are left to the caller.
+        if not self.enabled:
+            return {}
+        by_id, _ = self._load()
+        found = {}
+        for _id in ids:
+            obj = self._count(by_id.get(_id))
+            if obj is None:
+                continue
+            # Prefer an instance the session already holds; merging over it
+            # would reset pending collection changes made earlier in the request
+            attached = db.session.identity_map.get(identity_key(self.model, _id))
+            found[_id] = attached if attached is not None else db.session.merge(obj, load=False)
+        return found
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "size": len(self.by_id) if self.by_id is not None else 0,
+            "version": self.version,
+        }
+
+
+affiliation_cache = LookupCache(Affiliation)
+occupation_cache = LookupCache(Occupation)
+
+lookup_caches = {
+    Affiliation: affiliation_cache,
+    Occupation: occupation_cache,
+}
+
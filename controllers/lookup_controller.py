@@ -1,63 +1,188 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, abort, current_app
 from init import db
+from models.character import Character
 from models.lookup_tables import Affiliation, Occupation
+from models.junction_tables import character_affiliation, character_occupation
 from schemas.lookup_schema import (
     affiliation_schema,
     affiliations_schema,
     occupation_schema,
     occupations_schema,
 )
+from schemas.character_schema import character_schema_for
 from controllers.helpers import (
     load_schema_or_abort,
-    commit_or_abort,
+    commit_lookup_change,
     get_json_or_empty,
     fetch_or_abort,
+    make_etag,
+    not_modified_or_none,
+    with_validators,
+    touch_linked_characters,
+    serialize,
+    commit_or_abort,
+    get_or_create_lookup_ids,
+    get_int_arg_or_abort,
+    next_page_link,
 )
+from controllers.character_queries import get_fieldset_or_abort, fieldset_options
+from controllers.changes import DELETE, record_change
+from controllers.lookup_cache import affiliation_cache, occupation_cache
+from response_cache import cached
 
 lookups = Blueprint("lookups", __name__, url_prefix="/lookups")
 
 
+def get_or_create_lookups(model, schema):
+    # POST with a JSON array: every name is looked up and the missing ones
+    # created in one pass, concurrency-safe. Existing names are not an
+    # error; the response lists {id, name} in request order.
+    items = load_schema_or_abort(schema, data=request.json)
+    if any("name" not in item for item in items):
+        abort(400, description={"errors": {"name": ["Missing data for required field."]}})
+    names = [item["name"] for item in items]
+    ids = get_or_create_lookup_ids(model, names)
+    commit_or_abort()
+    return jsonify([{"id": ids[name], "name": name} for name in names]), 201
+
+
+def get_linked_characters(lookup, junction, column):
+    # One page of the characters linked to a lookup, in id order:
+    # ?limit=<n>&after=<last id seen>, plus the sparse fieldset parameters.
+    # The ids come from a range scan of the (lookup id, character id) index
+    # on the junction table and the total from an index-only COUNT, so
+    # neither loads the rest of the collection.
+    only = get_fieldset_or_abort()
+    limit = get_int_arg_or_abort(
+        "limit",
+        default=current_app.config["PAGE_SIZE"],
+        minimum=1,
+        maximum=current_app.config["MAX_PAGE_SIZE"],
+    )
+    after = get_int_arg_or_abort("after", minimum=0)
+
+    linked = junction.c[column] == lookup.id
+    stmt = db.select(junction.c.character_id).where(linked).order_by(junction.c.character_id).limit(limit + 1)
+    if after is not None:
+        stmt = stmt.where(junction.c.character_id > after)
+    ids = list(db.session.scalars(stmt))
+    count = db.session.scalar(db.select(db.func.count()).select_from(junction).where(linked))
+
+    headers = {}
+    if len(ids) > limit:
+        ids = ids[:limit]
+        headers["Link"] = next_page_link(after=ids[-1])
+
+    characters_list = []
+    if ids:
+        stmt = db.select(Character).options(*fieldset_options(only)).where(Character.id.in_(ids))
+        by_id = {character.id: character for character in db.session.scalars(stmt)}
+        characters_list = [by_id[_id] for _id in ids if _id in by_id]
+
+    etag = make_etag(
+        "linked", junction.name, lookup.id, lookup.updated_at, request.query_string, count,
+        [(c.id, c.updated_at) for c in characters_list],
+    )
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+    result = {"count": count, "characters": serialize(character_schema_for(only, many=True), characters_list)}
+    return with_validators(jsonify(result), etag), 200, headers
+
+
 # GET endpoint for affiliations
 @lookups.route("/affiliations/", methods=["GET"])
+@cached("affiliation")
 def get_affiliations():
-    stmt = db.select(Affiliation)
-    affiliations_list = db.session.scalars(stmt)
-    result = affiliations_schema.dump(affiliations_list)
-    return jsonify(result), 200
+    affiliations_list = affiliation_cache.all()
+    if affiliations_list is None:
+        stmt = db.select(Affiliation)
+        affiliations_list = db.session.scalars(stmt).all()
+    etag = make_etag("affiliations", [(row.id, row.updated_at) for row in affiliations_list])
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+    result = serialize(affiliations_schema, affiliations_list)
+    return with_validators(jsonify(result), etag), 200
 
 
 # GET single affiliation
 @lookups.route("/affiliations/<int:id>/", methods=["GET"])
+@cached("affiliation:{id}")
 def get_affiliation(id):
-    affiliation = fetch_or_abort(Affiliation, id, not_found_message="Affiliation doesn't exist")
-    return jsonify(affiliation_schema.dump(affiliation)), 200
+    affiliation = affiliation_cache.get(id) or fetch_or_abort(
+        Affiliation, id, not_found_message="Affiliation doesn't exist"
+    )
+    etag = make_etag("affiliation", affiliation.id, affiliation.updated_at)
+    not_modified = not_modified_or_none(etag, affiliation.updated_at)
+    if not_modified:
+        return not_modified
+    return with_validators(jsonify(serialize(affiliation_schema, affiliation)), etag, affiliation.updated_at), 200
+
+
+# GET the characters linked to an affiliation, paginated
+@lookups.route("/affiliations/<int:id>/characters", methods=["GET"], strict_slashes=False)
+@cached("affiliation:{id}", "character")
+def get_affiliation_characters(id):
+    affiliation = affiliation_cache.get(id) or fetch_or_abort(
+        Affiliation, id, not_found_message="Affiliation doesn't exist"
+    )
+    return get_linked_characters(affiliation, character_affiliation, "affiliation_id")
 
 
 # GET endpoint for occupations
 @lookups.route("/occupations/", methods=["GET"])
+@cached("occupation")
 def get_occupations():
-    stmt = db.select(Occupation)
-    occupations_list = db.session.scalars(stmt)
-    result = occupations_schema.dump(occupations_list)
-    return jsonify(result), 200
+    occupations_list = occupation_cache.all()
+    if occupations_list is None:
+        stmt = db.select(Occupation)
+        occupations_list = db.session.scalars(stmt).all()
+    etag = make_etag("occupations", [(row.id, row.updated_at) for row in occupations_list])
+    not_modified = not_modified_or_none(etag)
+    if not_modified:
+        return not_modified
+    result = serialize(occupations_schema, occupations_list)
+    return with_validators(jsonify(result), etag), 200
 
 
 # GET single occupation
 @lookups.route("/occupations/<int:id>/", methods=["GET"])
+@cached("occupation:{id}")
 def get_occupation(id):
-    occupation = fetch_or_abort(Occupation, id, not_found_message="Occupation doesn't exist")
-    return jsonify(occupation_schema.dump(occupation)), 200
+    occupation = occupation_cache.get(id) or fetch_or_abort(
+        Occupation, id, not_found_message="Occupation doesn't exist"
+    )
+    etag = make_etag("occupation", occupation.id, occupation.updated_at)
+    not_modified = not_modified_or_none(etag, occupation.updated_at)
+    if not_modified:
+        return not_modified
+    return with_validators(jsonify(serialize(occupation_schema, occupation)), etag, occupation.updated_at), 200
+
+
+# GET the characters linked to an occupation, paginated
+@lookups.route("/occupations/<int:id>/characters", methods=["GET"], strict_slashes=False)
+@cached("occupation:{id}", "character")
+def get_occupation_characters(id):
+    occupation = occupation_cache.get(id) or fetch_or_abort(
+        Occupation, id, not_found_message="Occupation doesn't exist"
+    )
+    return get_linked_characters(occupation, character_occupation, "occupation_id")
 
 
 # POST endpoint for occupations
 @lookups.route("/occupations/", methods=["POST"])
 def create_occupation():
+    if isinstance(request.json, list):
+        return get_or_create_lookups(Occupation, occupations_schema)
     occupation_fields = load_schema_or_abort(occupation_schema, data=request.json)
 
     new_occupation = Occupation()
     new_occupation.name = occupation_fields["name"]
     db.session.add(new_occupation)
-    commit_or_abort()
+    db.session.flush()
+    record_change(Occupation.__tablename__, new_occupation.id)
+    commit_lookup_change(Occupation)
 
     return jsonify(occupation_schema.dump(new_occupation)), 201
 
@@ -65,12 +190,16 @@ def create_occupation():
 # POST endpoint for affiliations
 @lookups.route("/affiliations/", methods=["POST"])
 def create_affiliation():
+    if isinstance(request.json, list):
+        return get_or_create_lookups(Affiliation, affiliations_schema)
     affiliation_fields = load_schema_or_abort(affiliation_schema, data=request.json)
 
     new_affiliation = Affiliation()
     new_affiliation.name = affiliation_fields["name"]
     db.session.add(new_affiliation)
-    commit_or_abort()
+    db.session.flush()
+    record_change(Affiliation.__tablename__, new_affiliation.id)
+    commit_lookup_change(Affiliation)
 
     return jsonify(affiliation_schema.dump(new_affiliation)), 201
 
@@ -79,8 +208,10 @@ def create_affiliation():
 @lookups.route("/affiliations/<int:id>/", methods=["DELETE"])
 def delete_affiliation(id):
     affiliation = fetch_or_abort(Affiliation, id, not_found_message="Affiliation doesn't exist", http_code=400)
+    touch_linked_characters(character_affiliation, "affiliation_id", affiliation.id)
     db.session.delete(affiliation)
-    commit_or_abort()
+    record_change(Affiliation.__tablename__, affiliation.id, DELETE)
+    commit_lookup_change(Affiliation)
     return jsonify({"success": "affiliation deleted"}), 200
 
 
@@ -88,8 +219,10 @@ def delete_affiliation(id):
 @lookups.route("/occupations/<int:id>/", methods=["DELETE"])
 def delete_occupation(id):
     occupation = fetch_or_abort(Occupation, id, not_found_message="Occupation doesn't exist", http_code=400)
+    touch_linked_characters(character_occupation, "occupation_id", occupation.id)
     db.session.delete(occupation)
-    commit_or_abort()
+    record_change(Occupation.__tablename__, occupation.id, DELETE)
+    commit_lookup_change(Occupation)
     return jsonify({"success": "occupation deleted"}), 200
 
 
@@ -99,7 +232,9 @@ def update_affiliation(id):
     affiliation = fetch_or_abort(Affiliation, id, not_found_message="Affiliation doesn't exist")
     affiliation_fields = load_schema_or_abort(affiliation_schema, data=request.json)
     affiliation.name = affiliation_fields["name"]
-    commit_or_abort()
+    touch_linked_characters(character_affiliation, "affiliation_id", affiliation.id)
+    record_change(Affiliation.__tablename__, affiliation.id)
+    commit_lookup_change(Affiliation)
     return jsonify(affiliation_schema.dump(affiliation)), 200
 
 
@@ -114,8 +249,10 @@ def patch_affiliation(id):
     if "name" in data:
         affiliation_fields = load_schema_or_abort(affiliation_schema, data={"name": data["name"]})
         affiliation.name = affiliation_fields["name"]
+        touch_linked_characters(character_affiliation, "affiliation_id", affiliation.id)
+        record_change(Affiliation.__tablename__, affiliation.id)
 
-    commit_or_abort()
+    commit_lookup_change(Affiliation)
     return jsonify(affiliation_schema.dump(affiliation)), 200
 
 
@@ -125,7 +262,9 @@ def update_occupation(id):
     occupation = fetch_or_abort(Occupation, id, not_found_message="Occupation doesn't exist")
     occupation_fields = load_schema_or_abort(occupation_schema, data=request.json)
     occupation.name = occupation_fields["name"]
-    commit_or_abort()
+    touch_linked_characters(character_occupation, "occupation_id", occupation.id)
+    record_change(Occupation.__tablename__, occupation.id)
+    commit_lookup_change(Occupation)
     return jsonify(occupation_schema.dump(occupation)), 200
 
 
@@ -140,6 +279,17 @@ def patch_occupation(id):
     if "name" in data:
         occupation_fields = load_schema_or_abort(occupation_schema, data={"name": data["name"]})
         occupation.name = occupation_fields["name"]
+        touch_linked_characters(character_occupation, "occupation_id", occupation.id)
+        record_change(Occupation.__tablename__, occupation.id)
 
-    commit_or_abort()
+    commit_lookup_change(Occupation)
     return jsonify(occupation_schema.dump(occupation)), 200
+
+
+# GET hit/miss counters of the per-process lookup cache
+@lookups.route("/cache/", methods=["GET"])
+def get_lookup_cache_stats():
+    return jsonify({
+        "affiliations": affiliation_cache.stats(),
+        "occupations": occupation_cache.stats(),
+    }), 200
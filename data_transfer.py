@@ -0,0 +1,242 @@
+import csv
+import json
+import os
+import time
+from flask import current_app
+from sqlalchemy.orm import selectinload
+from init import db
+from models.character import Character
+from models.import_checkpoint import ImportCheckpoint
+from schemas.character_schema import characters_schema
+from controllers.bulk import CHARACTER_COLUMNS, bulk_write_characters
+from response_cache import invalidate_stale
+
+# File import and export for `flask db import` / `flask db export`, in
+# NDJSON (one character per line) or CSV. Both stream: records are read,
+# validated and written chunk by chunk through the same path as
+# POST /characters/bulk, and every chunk is committed, so memory stays flat
+# however big the file is.
+#
+# Lookups are referenced by name (affiliation_names / occupation_names, "|"
+# separated in CSV) and created when missing, so an export imports into an
+# empty database as it is.
+#
+# Every chunk commits together with a checkpoint row (import_checkpoint):
+# the byte offset reached and the running totals. Running the same import
+# again resumes from there instead of writing the same rows twice.
+
+FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+LIST_FIELDS = [
+    "affiliation_names", "occupation_names",
+    "affiliation_ids", "occupation_ids",
+]
+EXPORT_FIELDS = ["id", *CHARACTER_COLUMNS, "affiliation_names", "occupation_names"]
+CSV_SEPARATOR = "|"
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    fmt = FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Can't tell the format of {path}; use --format ndjson or csv")
+    return fmt
+
+
+CHECKPOINT_FIELDS = ["offset", "records", "created", "updated", "failed"]
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(path):
+    # Returns the saved state, or None to start from the beginning
+    checkpoint = db.session.get(ImportCheckpoint, os.path.abspath(path))
+    if checkpoint is None:
+        return None
+    signature = file_signature(path)
+    if (checkpoint.size, checkpoint.mtime) != (signature["size"], signature["mtime"]):
+        raise ValueError(
+            f"{path} changed since its import was interrupted; "
+            "use --restart to import it from the beginning"
+        )
+    return {"file": signature, **{field: getattr(checkpoint, field) for field in CHECKPOINT_FIELDS}}
+
+
+def save_checkpoint(path, state):
+    # Added to the current transaction; the caller commits it with the chunk
+    db.session.merge(ImportCheckpoint(
+        path=os.path.abspath(path),
+        size=state["file"]["size"],
+        mtime=state["file"]["mtime"],
+        **{field: state[field] for field in CHECKPOINT_FIELDS},
+    ))
+
+
+def delete_checkpoint(path):
+    db.session.execute(db.delete(ImportCheckpoint).where(ImportCheckpoint.path == os.path.abspath(path)))
+    db.session.commit()
+
+
+def read_lines(f, position):
+    # Yields decoded lines and keeps position["offset"] at the end of the
+    # last line handed out, so a checkpoint can point just past a record
+    for raw in f:
+        position["offset"] += len(raw)
+        yield raw.decode("utf-8")
+
+
+def parse_csv_row(row):
+    # Empty cells are left out (the column keeps its default, or its current
+    # value on upserts); list columns are "|" separated
+    record = {}
+    for key, value in row.items():
+        if key is None or value is None or value == "":
+            continue
+        if key in LIST_FIELDS:
+            record[key] = [item for item in value.split(CSV_SEPARATOR) if item]
+        else:
+            record[key] = value
+    return record
+
+
+def read_records(path, fmt, offset=0):
+    # Yields (record, offset after it); records that aren't valid JSON come
+    # through as the raw line so the caller reports them with the rest
+    loads = current_app.json.loads
+    with open(path, "rb") as f:
+        header = None
+        if fmt == "csv":
+            header = next(csv.reader([f.readline().decode("utf-8-sig")]), None)
+            if not header:
+                return
+            offset = max(offset, f.tell())
+        f.seek(offset)
+        position = {"offset": offset}
+        lines = read_lines(f, position)
+        if fmt == "csv":
+            for row in csv.DictReader(lines, fieldnames=header):
+                yield parse_csv_row(row), position["offset"]
+        else:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = loads(line)
+                except ValueError:
+                    record = line
+                yield record, position["offset"]
+
+
+def commit_chunk():
+    db.session.commit()
+    # Lookups created by name; see commit_or_abort()
+    for cache in db.session.info.pop("stale_lookup_caches", ()):
+        cache.invalidate()
+    invalidate_stale(db.session)
+    # Nothing from this chunk is needed any more
+    db.session.expunge_all()
+
+
+def import_file(path, fmt=None, chunk_size=1000, upsert=False, restart=False, errors=None, progress=None):
+    # Returns the totals: {"records", "created", "updated", "failed"}
+    fmt = detect_format(path, fmt)
+    if restart:
+        delete_checkpoint(path)
+    state = load_checkpoint(path) or {
+        "file": file_signature(path),
+        "offset": 0,
+        "records": 0,
+        "created": 0,
+        "updated": 0,
+        "failed": 0,
+    }
+    resumed_at = state["records"]
+    started = time.perf_counter()
+    errors_file = open(errors, "a" if resumed_at else "w") if errors else None
+
+    def flush(chunk, offset):
+        records = [record for record, _ in chunk]
+        for result in bulk_write_characters(records, upsert=upsert):
+            if result["status"] == "error":
+                state["failed"] += 1
+                if errors_file:
+                    number = chunk[result["index"]][1]
+                    errors_file.write(json.dumps({"record": number, "errors": result["errors"]}) + "\n")
+            else:
+                state[result["status"]] += 1
+        state["records"] += len(chunk)
+        state["offset"] = offset
+        if errors_file:
+            errors_file.flush()
+        save_checkpoint(path, state)
+        commit_chunk()
+        if progress:
+            progress(state, state["records"] - resumed_at, time.perf_counter() - started)
+
+    try:
+        chunk = []
+        for record, offset in read_records(path, fmt, state["offset"]):
+            # Keep the record number for the error report
+            chunk.append((record, state["records"] + len(chunk) + 1))
+            if len(chunk) == chunk_size:
+                flush(chunk, offset)
+                chunk = []
+        if chunk:
+            flush(chunk, offset)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if errors_file:
+            errors_file.close()
+
+    # Finished: a later run of the same file starts over
+    delete_checkpoint(path)
+    return state
+
+
+def export_record(data):
+    # Dumped character -> import-ready record (lookups by name). Empty
+    # columns are left out, since the schema doesn't accept nulls.
+    record = {field: data[field] for field in ["id", *CHARACTER_COLUMNS] if data.get(field) is not None}
+    record["affiliation_names"] = [item["name"] for item in data.get("affiliations", [])]
+    record["occupation_names"] = [item["name"] for item in data.get("occupations", [])]
+    return record
+
+
+def export_file(path, fmt=None, chunk_size=1000, progress=None):
+    # Returns the number of characters written
+    fmt = detect_format(path, fmt)
+    dumps = current_app.json.dumps
+    stmt = (
+        db.select(Character)
+        .options(selectinload(Character.affiliations), selectinload(Character.occupations))
+        .order_by(Character.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    count = 0
+    started = time.perf_counter()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_FIELDS)
+        for chunk in db.session.scalars(stmt).partitions():
+            records = [export_record(data) for data in characters_schema.dump(chunk)]
+            if writer is not None:
+                writer.writerows(
+                    [
+                        CSV_SEPARATOR.join(value) if isinstance(value, list) else ("" if value is None else value)
+                        for value in (record.get(field) for field in EXPORT_FIELDS)
+                    ]
+                    for record in records
+                )
+            else:
+                f.write("".join(dumps(record) + "\n" for record in records))
+            count += len(records)
+            if progress:
+                progress(count, time.perf_counter() - started)
+    return count
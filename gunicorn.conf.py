@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+
+# Deployment profile: gunicorn -c gunicorn.conf.py wsgi:app
+# (gunicorn also picks this file up by default when started from the
+# project root). Every setting can be changed through the env vars below.
+#
+# With preload_app the app is imported and built once in the master and
+# workers are forked from it, so boot is faster and the code is shared
+# copy-on-write. Each worker then drops any connections it inherited and
+# warms itself (pool connections, mappers, serializers, lookup cache)
+# before it accepts requests; see warmup.py.
+
+
+def env_flag(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, "") else value.lower() in ("1", "true", "yes")
+
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# sync, gthread, or an async class such as gevent if it is installed. With
+# gthread, keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above the thread count.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.environ.get("GUNICORN_THREADS", "1"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+preload_app = env_flag("GUNICORN_PRELOAD", True)
+# Load the affiliation/occupation tables into each worker's cache at boot
+warm_lookups = env_flag("GUNICORN_WARM_LOOKUPS", True)
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from warmup import prime_code
+        prime_code()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from warmup import dispose_engines
+        dispose_engines(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    from warmup import warm_up
+    stats = warm_up(worker.wsgi, lookups=warm_lookups)
+    worker.log.info(
+        "Worker warmed up in %.1f ms (%d pool connections)",
+        stats["seconds"] * 1000, stats["connections"],
+    )
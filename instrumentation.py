@@ -0,0 +1,187 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request instrumentation: SQL statement count, DB time, serialization
+# time and total time for every request. They are sent back as a
+# Server-Timing header, logged as one JSON line, and aggregated into
+# per-route histograms served at /metrics in Prometheus text format.
+#
+# The hot path is a few perf_counter() calls and integer additions per
+# request and per statement, so it is meant to stay on in production. The
+# histograms are per process; Prometheus sums them across workers.
+
+logger = logging.getLogger("gundam_api.requests")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Total time spent handling the request.", LATENCY_BUCKETS),
+    "http_request_db_seconds": ("Time spent executing SQL statements.", LATENCY_BUCKETS),
+    "http_request_serialization_seconds": ("Time spent dumping response data.", LATENCY_BUCKETS),
+    "http_request_sql_statements": ("SQL statements executed per request.", STATEMENT_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, labels, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, labels)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = Histogram(HISTOGRAMS[name][1])
+                histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, labels), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.total}')
+                    lines.append(f"{name}_sum{{{label_text}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{label_text}}} {histogram.total}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def current_metrics():
+    if has_request_context():
+        return g.get("request_metrics")
+    return None
+
+
+@contextmanager
+def track(name):
+    # Adds the block's duration to the current request's `name` timer
+    metrics = current_metrics()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics[name] += time.perf_counter() - start
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_metrics() is not None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics = current_metrics()
+    if metrics is not None and conn.info.get("query_start"):
+        metrics["db"] += time.perf_counter() - conn.info["query_start"].pop()
+        metrics["statements"] += 1
+
+
+def start_request():
+    g.request_metrics = {"start": time.perf_counter(), "db": 0.0, "serialize": 0.0, "statements": 0}
+
+
+def finish_request(response):
+    metrics = g.pop("request_metrics", None)
+    if metrics is None:
+        return response
+    total = time.perf_counter() - metrics["start"]
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+
+    response.headers["Server-Timing"] = (
+        f'db;dur={metrics["db"] * 1000:.2f};desc="{metrics["statements"]} statements", '
+        f'serialize;dur={metrics["serialize"] * 1000:.2f}, '
+        f"total;dur={total * 1000:.2f}"
+    )
+    labels = (("method", request.method), ("route", route), ("status", str(response.status_code)))
+    registry.observe(labels, {
+        "http_request_duration_seconds": total,
+        "http_request_db_seconds": metrics["db"],
+        "http_request_serialization_seconds": metrics["serialize"],
+        "http_request_sql_statements": metrics["statements"],
+    })
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({
+            "method": request.method,
+            "route": route,
+            "path": request.path,
+            "status": response.status_code,
+            "sql_statements": metrics["statements"],
+            "db_ms": round(metrics["db"] * 1000, 3),
+            "serialize_ms": round(metrics["serialize"] * 1000, 3),
+            "total_ms": round(total * 1000, 3),
+        }))
+    return response
+
+
+def metrics_view():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def configure_request_log():
+    # Nothing else gives this logger a level or a handler, and the root
+    # logger's default WARNING would drop every line. One message per line
+    # on stderr (gunicorn's error log), not passed on to the root handlers,
+    # unless the deployment has already set up handlers of its own.
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def init_app(app):
+    if not app.config["INSTRUMENTATION_ENABLED"]:
+        return
+    if app.config["REQUEST_LOG_ENABLED"]:
+        configure_request_log()
+    # Engine-level listeners cover every engine/bind; add them only once
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
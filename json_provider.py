@@ -0,0 +1,43 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON provider backed by orjson, used when it is installed and FAST_JSON
+# is on (see main.py). The output is the same JSON as Flask's default
+# provider's, with sorted keys and the same handling of non-JSON types.
+# Dates and datetimes go through Flask's default() (HTTP date strings) rather
+# than orjson's ISO format. The only difference is that non-ASCII text is
+# sent as UTF-8 instead of \u escapes.
+#
+# Calls with extra json.dumps()/loads() arguments fall back to the stdlib.
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = OPTIONS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=self.default, option=option) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app):
+    if app.config["FAST_JSON"] and orjson is not None:
+        app.json = OrjsonProvider(app)
@@ -2,6 +2,10 @@ from flask import Flask, jsonify
 from werkzeug.exceptions import HTTPException
 from marshmallow import ValidationError
 from init import db, ma
+import instrumentation
+import compression
+import json_provider
+import response_cache
 
 def create_app():
     
@@ -14,6 +18,19 @@ def create_app():
     # initialising our database object with the flask app
     db.init_app(app)
     ma.init_app(app)
+
+    # orjson-backed jsonify() when available
+    json_provider.init_app(app)
+
+    # SQL/serialization timings, Server-Timing header and /metrics
+    instrumentation.init_app(app)
+
+    # gzip/brotli; registered after instrumentation so its after_request
+    # hook runs first and the compression time counts towards the total
+    compression.init_app(app)
+
+    # Server-side GET response cache (off unless RESPONSE_CACHE_ENABLED)
+    response_cache.init_app(app)
     
     from commands import db_commands
     app.register_blueprint(db_commands)
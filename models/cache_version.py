@@ -0,0 +1,8 @@
+from init import db
+
+# One row per cached table. Write handlers bump the counter in the same
+# transaction as their change so every worker can tell its cache is stale.
+class CacheVersion(db.Model):
+    __tablename__ = "cache_version"
+    name = db.Column(db.String(), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
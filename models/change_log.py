@@ -0,0 +1,112 @@
+from sqlalchemy import text
+from init import db
+from models.table_setup import after_table_created
+from models.timestamps import utcnow
+
+# Append-only log behind GET /changes. Every write records the rows it
+# touched, in the same transaction: "upsert" for creates and updates
+# (including link changes and renames of embedded lookups), "delete" as a
+# tombstone. seq only ever grows, so it doubles as the feed cursor.
+class ChangeLog(db.Model):
+    __tablename__ = "change_log"
+    # AUTOINCREMENT keeps SQLite from reusing the highest seq after deletes
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+
+# The latest change_log row of each entity, which is what the feed serves.
+# A trigger on change_log upserts it, and a feed page is a range scan of
+# ix_change_latest_seq instead of a GROUP BY over the whole log after the
+# cursor.
+class ChangeLatest(db.Model):
+    __tablename__ = "change_latest"
+
+    entity = db.Column(db.String(), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, unique=True, index=True)
+    op = db.Column(db.String(), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+
+# A lower seq never overwrites a higher one (on PostgreSQL transactions
+# can commit out of seq order)
+UPSERT_LATEST = (
+    "ON CONFLICT (entity, entity_id) DO UPDATE SET seq = excluded.seq, op = excluded.op, "
+    "changed_at = excluded.changed_at WHERE excluded.seq > change_latest.seq"
+)
+
+# PostgreSQL hands out seq when a row is inserted, not when its transaction
+# commits, so a lower seq can become visible after a higher one. Before
+# taking seqs, every INSERT into change_log holds a shared transaction-level
+# advisory lock (CHANGE_FEED_LOCK, last seq handed out so far) until its
+# transaction ends. pg_locks shows those locks to every session, so the
+# feed can tell which seqs may still commit (FEED_HORIZON_SQL).
+CHANGE_FEED_LOCK = 7318
+
+CHANGE_FEED_DDL = {
+    "sqlite": [
+        "CREATE TRIGGER IF NOT EXISTS change_log_latest_ai AFTER INSERT ON change_log BEGIN "
+        "INSERT INTO change_latest (entity, entity_id, seq, op, changed_at) "
+        f"VALUES (new.entity, new.entity_id, new.seq, new.op, new.changed_at) {UPSERT_LATEST}; END",
+    ],
+    "postgresql": [
+        # Statement-level, so an INSERT ... SELECT of many rows upserts once;
+        # DISTINCT ON because one statement can't update a row twice
+        "CREATE OR REPLACE FUNCTION change_log_latest() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "INSERT INTO change_latest (entity, entity_id, seq, op, changed_at) "
+        "SELECT DISTINCT ON (entity, entity_id) entity, entity_id, seq, op, changed_at FROM new_rows "
+        f"ORDER BY entity, entity_id, seq DESC {UPSERT_LATEST}; "
+        "RETURN NULL; END $$",
+        "DROP TRIGGER IF EXISTS change_log_latest ON change_log",
+        "CREATE TRIGGER change_log_latest AFTER INSERT ON change_log REFERENCING NEW TABLE AS new_rows "
+        "FOR EACH STATEMENT EXECUTE FUNCTION change_log_latest()",
+        # Runs before the statement evaluates nextval() for its rows, so
+        # every seq it takes is at least the locked value
+        "CREATE OR REPLACE FUNCTION change_log_reserve() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        f"PERFORM pg_advisory_xact_lock_shared({CHANGE_FEED_LOCK}, "
+        "(SELECT last_value FROM change_log_seq_seq)::integer); "
+        "RETURN NULL; END $$",
+        "DROP TRIGGER IF EXISTS change_log_reserve ON change_log",
+        "CREATE TRIGGER change_log_reserve BEFORE INSERT ON change_log "
+        "FOR EACH STATEMENT EXECUTE FUNCTION change_log_reserve()",
+    ],
+}
+
+# The highest seq the feed may serve: every seq handed out so far, minus
+# those from the lowest one a still-running transaction may hold. It must
+# run before the page is read, on the primary: seqs handed out later are
+# above it, and a writer that held a lower one has either committed before
+# the page's snapshot or still shows up here.
+FEED_HORIZON_SQL = (
+    "SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END, "
+    "(SELECT min(objid::bigint) - 1 FROM pg_locks "
+    f"WHERE locktype = 'advisory' AND classid = {CHANGE_FEED_LOCK} AND objsubid = 2) "
+    "FROM change_log_seq_seq"
+)
+
+# Fills change_latest from a log that predates it
+BACKFILL_SQL = (
+    "INSERT INTO change_latest (entity, entity_id, seq, op, changed_at) "
+    "SELECT entity, entity_id, seq, op, changed_at FROM change_log "
+    "WHERE seq IN (SELECT max(seq) FROM change_log GROUP BY entity, entity_id)"
+)
+
+
+def has_change_latest(dialect_name):
+    return dialect_name in CHANGE_FEED_DDL
+
+
+def create_change_feed(connection):
+    # Runs once, when change_latest is created
+    for statement in CHANGE_FEED_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+    if has_change_latest(connection.dialect.name):
+        connection.execute(text(BACKFILL_SQL))
+
+
+after_table_created(ChangeLatest.__table__, create_change_feed)
@@ -1,8 +1,21 @@
 from init import db
 from models.junction_tables import character_affiliation, character_occupation
+from models.timestamps import utcnow
+from models.search_index import register_search_index
 
 class Character(db.Model):
     __tablename__ = "character"
+    # Filter/sort columns of GET /characters/. Each index ends with id so a
+    # filtered or sorted page is a range scan in keyset order.
+    __table_args__ = (
+        db.Index("ix_character_name_id", "name", "id"),
+        db.Index("ix_character_birth_year_id", "birth_year", "id"),
+        db.Index("ix_character_classification_id", "classification", "id"),
+        db.Index("ix_character_place_of_birth_id", "place_of_birth", "id"),
+        db.Index("ix_character_rank_id", "rank", "id"),
+        db.Index("ix_character_status_id", "status", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False)
     birth_year = db.Column(db.Date, nullable=True)
@@ -10,6 +23,8 @@ class Character(db.Model):
     place_of_birth = db.Column(db.String(), nullable=True)
     rank = db.Column(db.String(), nullable=True)
     status = db.Column(db.String(), nullable=False)
+    # Bumped on every change to the row, its links or the lookups it links to
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
 
     affiliations = db.relationship(
         "Affiliation",
@@ -20,4 +35,6 @@ class Character(db.Model):
         "Occupation",
         secondary=character_occupation,
         back_populates="characters"
-    )
\ No newline at end of file
+    )
+
+register_search_index(Character.__table__)
@@ -0,0 +1,208 @@
+from sqlalchemy import text
+from init import db
+from models.character import Character
+from models.table_setup import after_table_created
+
+# Rollup behind GET /characters/stats: character counts per classification,
+# status, rank, affiliation and occupation, plus the total, kept up to date
+# by triggers like the search index (models/search_index.py).
+#
+# character_stat holds one count per (dimension, value). value is the
+# column's text ('' with missing set for NULL) or the lookup id.
+#
+# SQLite has a single writer, so its row triggers add to character_stat
+# directly. On PostgreSQL concurrent writers would queue on the hot rows
+# ("total", the common statuses), so statement triggers only append their
+# net changes to character_stat_delta, which takes no locks. Readers sum
+# both tables, and compact_stats() folds the deltas in from time to time.
+
+COLUMN_DIMENSIONS = ["classification", "status", "rank"]
+# dimension -> (junction table, junction column)
+LINK_DIMENSIONS = {
+    "affiliation": ("character_affiliation", "affiliation_id"),
+    "occupation": ("character_occupation", "occupation_id"),
+}
+
+
+class CharacterStat(db.Model):
+    __tablename__ = "character_stat"
+
+    dimension = db.Column(db.String(), primary_key=True)
+    value = db.Column(db.String(), primary_key=True)
+    missing = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CharacterStatDelta(db.Model):
+    __tablename__ = "character_stat_delta"
+
+    id = db.Column(db.Integer, primary_key=True)
+    dimension = db.Column(db.String(), nullable=False)
+    value = db.Column(db.String(), nullable=False)
+    missing = db.Column(db.Boolean, nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+
+
+def sqlite_ddl():
+    upsert = (
+        "INSERT INTO character_stat (dimension, value, missing, count) VALUES {values} "
+        "ON CONFLICT (dimension, value, missing) DO UPDATE SET count = count + excluded.count;"
+    )
+
+    def column_value(row, column, sign):
+        return f"('{column}', coalesce({row}.{column}, ''), {row}.{column} IS NULL, {sign})"
+
+    def character_values(row, sign):
+        return ", ".join([f"('total', '', 0, {sign})"] + [column_value(row, c, sign) for c in COLUMN_DIMENSIONS])
+
+    statements = [
+        "CREATE TRIGGER IF NOT EXISTS character_stat_ai AFTER INSERT ON character BEGIN "
+        + upsert.format(values=character_values("new", 1)) + " END",
+        "CREATE TRIGGER IF NOT EXISTS character_stat_ad AFTER DELETE ON character BEGIN "
+        + upsert.format(values=character_values("old", -1)) + " END",
+    ]
+    for column in COLUMN_DIMENSIONS:
+        values = f"{column_value('old', column, -1)}, {column_value('new', column, 1)}"
+        statements.append(
+            f"CREATE TRIGGER IF NOT EXISTS character_stat_au_{column} AFTER UPDATE OF {column} ON character "
+            f"WHEN old.{column} IS NOT new.{column} BEGIN " + upsert.format(values=values) + " END"
+        )
+    for dimension, (junction, column) in LINK_DIMENSIONS.items():
+        for event_name, row, sign in (("INSERT", "new", 1), ("DELETE", "old", -1)):
+            values = f"('{dimension}', CAST({row}.{column} AS TEXT), 0, {sign})"
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {junction}_stat_a{event_name[0].lower()} "
+                f"AFTER {event_name} ON {junction} BEGIN " + upsert.format(values=values) + " END"
+            )
+    return statements
+
+
+def postgresql_ddl():
+    def character_rows(source, sign):
+        parts = [f"SELECT 'total' AS dimension, '' AS value, false AS missing, {sign} AS delta FROM {source}"]
+        parts += [
+            f"SELECT '{c}', coalesce({c}, ''), {c} IS NULL, {sign} FROM {source}" for c in COLUMN_DIMENSIONS
+        ]
+        return " UNION ALL ".join(parts)
+
+    def append(rows):
+        # One delta row per (dimension, value) the statement changed
+        return (
+            "INSERT INTO character_stat_delta (dimension, value, missing, delta) "
+            f"SELECT dimension, value, missing, sum(delta) FROM ({rows}) AS changes "
+            "GROUP BY dimension, value, missing HAVING sum(delta) <> 0;"
+        )
+
+    def function(name, insert_rows, delete_rows):
+        return (
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+            f"IF TG_OP = 'INSERT' THEN {append(insert_rows)} "
+            f"ELSIF TG_OP = 'DELETE' THEN {append(delete_rows)} "
+            f"ELSE {append(insert_rows + ' UNION ALL ' + delete_rows)} "
+            "END IF; RETURN NULL; END $$"
+        )
+
+    def triggers(table, name, operations):
+        # Statement-level with transition tables, so a bulk INSERT or COPY
+        # appends a handful of rows rather than one per character
+        statements = []
+        for operation in operations:
+            referencing = {
+                "INSERT": "NEW TABLE AS new_rows",
+                "DELETE": "OLD TABLE AS old_rows",
+                "UPDATE": "NEW TABLE AS new_rows OLD TABLE AS old_rows",
+            }[operation]
+            trigger = f"{table}_stat_{operation.lower()}"
+            statements += [
+                f"DROP TRIGGER IF EXISTS {trigger} ON {table}",
+                f"CREATE TRIGGER {trigger} AFTER {operation} ON {table} REFERENCING {referencing} "
+                f"FOR EACH STATEMENT EXECUTE FUNCTION {name}()",
+            ]
+        return statements
+
+    statements = [function("character_stat_changes", character_rows("new_rows", 1), character_rows("old_rows", -1))]
+    statements += triggers("character", "character_stat_changes", ["INSERT", "UPDATE", "DELETE"])
+    for dimension, (junction, column) in LINK_DIMENSIONS.items():
+        name = f"{junction}_stat_changes"
+
+        def link_rows(source, sign):
+            return (
+                f"SELECT '{dimension}' AS dimension, {column}::text AS value, false AS missing, "
+                f"{sign} AS delta FROM {source}"
+            )
+
+        statements.append(function(name, link_rows("new_rows", 1), link_rows("old_rows", -1)))
+        # Link rows are only ever inserted and deleted
+        statements += triggers(junction, name, ["INSERT", "DELETE"])
+    return statements
+
+
+ROLLUP_DDL = {
+    "sqlite": sqlite_ddl(),
+    "postgresql": postgresql_ddl(),
+}
+
+# Folds the pending deltas into character_stat. Only deltas visible when it
+# runs are deleted, so ones committed meanwhile wait for the next run.
+COMPACT_SQL = (
+    "WITH moved AS (DELETE FROM character_stat_delta RETURNING dimension, value, missing, delta) "
+    "INSERT INTO character_stat (dimension, value, missing, count) "
+    "SELECT dimension, value, missing, sum(delta) FROM moved GROUP BY dimension, value, missing "
+    "ON CONFLICT (dimension, value, missing) DO UPDATE SET count = character_stat.count + excluded.count"
+)
+
+
+def has_stats_rollup(dialect_name):
+    return dialect_name in ROLLUP_DDL
+
+
+def count_statement():
+    # (dimension, value, missing, count) straight from the tables
+    parts = [
+        db.select(db.literal("total"), db.literal(""), db.false(), db.func.count()).select_from(Character)
+    ]
+    for dimension in COLUMN_DIMENSIONS:
+        column = getattr(Character, dimension)
+        parts.append(
+            db.select(
+                db.literal(dimension), db.func.coalesce(column, ""), column.is_(None), db.func.count()
+            ).group_by(column)
+        )
+    for dimension, (junction, column) in LINK_DIMENSIONS.items():
+        table = db.metadata.tables[junction]
+        parts.append(
+            db.select(
+                db.literal(dimension), db.cast(table.c[column], db.String), db.false(), db.func.count()
+            ).group_by(table.c[column])
+        )
+    return db.union_all(*parts)
+
+
+def rebuild_stats_rollup(connection):
+    # Recounts everything from the tables. On PostgreSQL writers wait until
+    # the transaction ends, so no delta lands between the DELETE and the
+    # recount (which would count it twice); SQLite writers wait anyway.
+    if connection.dialect.name == "postgresql":
+        tables = ", ".join(["character"] + [junction for junction, _ in LINK_DIMENSIONS.values()])
+        connection.execute(text(f"LOCK TABLE {tables} IN SHARE MODE"))
+    connection.execute(CharacterStatDelta.__table__.delete())
+    connection.execute(CharacterStat.__table__.delete())
+    columns = ["dimension", "value", "missing", "count"]
+    connection.execute(CharacterStat.__table__.insert().from_select(columns, count_statement()))
+
+
+def create_stats_rollup(connection):
+    # Triggers plus the counts of rows that existed before them; runs once,
+    # when character_stat is created
+    for statement in ROLLUP_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+    if has_stats_rollup(connection.dialect.name):
+        rebuild_stats_rollup(connection)
+
+
+def compact_stats(connection):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(COMPACT_SQL))
+
+
+after_table_created(CharacterStat.__table__, create_stats_rollup)
@@ -0,0 +1,18 @@
+from init import db
+
+# Progress of an interrupted `flask db import`, one row per input file.
+# Saved in the same transaction as the chunk it covers, so the rows and the
+# offset past them are committed together or not at all.
+class ImportCheckpoint(db.Model):
+    __tablename__ = "import_checkpoint"
+    # Absolute path of the input file
+    path = db.Column(db.String(), primary_key=True)
+    # The file's size and mtime when the import started, to refuse resuming
+    # into a file that changed since
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime = db.Column(db.Float, nullable=False)
+    offset = db.Column(db.BigInteger, nullable=False)
+    records = db.Column(db.Integer, nullable=False)
+    created = db.Column(db.Integer, nullable=False)
+    updated = db.Column(db.Integer, nullable=False)
+    failed = db.Column(db.Integer, nullable=False)
@@ -1,3 +1,6 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from init import db
 
 character_affiliation = db.Table(
@@ -14,6 +17,9 @@ character_affiliation = db.Table(
         db.ForeignKey("affiliation.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    # The primary key only serves lookups starting from character_id; this
+    # one serves "characters with affiliation X" and the cascade on delete
+    db.Index("ix_character_affiliation_affiliation_id", "affiliation_id", "character_id"),
 )
 
 character_occupation = db.Table(
@@ -30,4 +36,16 @@ character_occupation = db.Table(
         db.ForeignKey("occupation.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    db.Index("ix_character_occupation_occupation_id", "occupation_id", "character_id"),
 )
+
+
+# The ON DELETE CASCADE above removes the links of a deleted lookup (see
+# passive_deletes in lookup_tables.py). SQLite only enforces foreign keys
+# when asked to, on every connection.
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
@@ -1,24 +1,36 @@
 from init import db
 from models.junction_tables import character_affiliation, character_occupation
+from models.timestamps import utcnow
 
 class Affiliation(db.Model):
     __tablename__ = "affiliation"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False, unique=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
 
+    # Write-only: never loaded as a whole (a popular lookup links to a
+    # large share of all characters). Page through them with
+    # GET /lookups/affiliations/<id>/characters instead. Deleting the lookup
+    # leaves the junction rows to ON DELETE CASCADE rather than loading them.
     characters = db.relationship(
         "Character",
         secondary=character_affiliation,
-        back_populates="affiliations"
+        back_populates="affiliations",
+        lazy="write_only",
+        passive_deletes=True,
     )
 
 class Occupation(db.Model):
     __tablename__ = "occupation"
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(), nullable=False, unique=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
 
+    # Write-only with passive deletes, as for Affiliation.characters
     characters = db.relationship(
         "Character",
         secondary=character_occupation,
-        back_populates="occupations"
+        back_populates="occupations",
+        lazy="write_only",
+        passive_deletes=True,
     )
\ No newline at end of file
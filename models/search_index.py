@@ -0,0 +1,48 @@
+from sqlalchemy import event, text
+
+# Name search index for GET /characters/search.
+#
+# PostgreSQL: a pg_trgm GIN index on character.name, which the database
+# keeps up to date itself.
+# SQLite: an external-content FTS5 table using the trigram tokenizer, kept
+# in sync with the character table by triggers, so every write path
+# (single, bulk, CLI) updates it without the application having to.
+
+SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX IF NOT EXISTS ix_character_name_trgm ON character USING gin (name gin_trgm_ops)",
+    ],
+    "sqlite": [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS character_fts USING fts5("
+        "name, content='character', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS character_fts_ai AFTER INSERT ON character BEGIN "
+        "INSERT INTO character_fts(rowid, name) VALUES (new.id, new.name); END",
+        "CREATE TRIGGER IF NOT EXISTS character_fts_ad AFTER DELETE ON character BEGIN "
+        "INSERT INTO character_fts(character_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+        "CREATE TRIGGER IF NOT EXISTS character_fts_au AFTER UPDATE OF name ON character BEGIN "
+        "INSERT INTO character_fts(character_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+        "INSERT INTO character_fts(rowid, name) VALUES (new.id, new.name); END",
+        # Index rows that existed before the table was created
+        "INSERT INTO character_fts(character_fts) VALUES ('rebuild')",
+    ],
+}
+
+DROP_DDL = {
+    "sqlite": ["DROP TABLE IF EXISTS character_fts"],
+}
+
+
+def create_search_index(connection):
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+def drop_search_index(connection):
+    for statement in DROP_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+def register_search_index(table):
+    event.listen(table, "after_create", lambda target, connection, **kw: create_search_index(connection))
+    event.listen(table, "before_drop", lambda target, connection, **kw: drop_search_index(connection))
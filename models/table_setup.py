@@ -0,0 +1,21 @@
+from sqlalchemy import event
+
+
+# Runs setup(connection) when `table` is actually created, never for a
+# create_all() that finds it already there. Setup that spans other tables
+# (triggers) waits until create_all() has created all of them.
+def after_table_created(table, setup):
+    key = f"created:{table.name}"
+
+    def table_created(target, connection, **kw):
+        if kw.get("_is_metadata_operation"):
+            connection.info[key] = True
+        else:
+            setup(connection)
+
+    def all_created(target, connection, **kw):
+        if connection.info.pop(key, False):
+            setup(connection)
+
+    event.listen(table, "after_create", table_created)
+    event.listen(table.metadata, "after_create", all_created)
@@ -0,0 +1,6 @@
+from datetime import datetime, timezone
+
+
+# Timestamps are stored as naive UTC so SQLite and PostgreSQL compare the same
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,37 @@
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+# Session that sends reads to the "replica" bind (DATABASE_READ_URL) when
+# one is configured. Only GET/HEAD requests use it, so every other method
+# reads and writes on the primary. Once a session flushes or executes an
+# INSERT/UPDATE/DELETE it is pinned to the primary for the rest of the
+# request, so reads never miss the request's own writes because of
+# replication lag. Code outside a request (CLI, benchmarks) always uses
+# the primary.
+
+READ_METHODS = ("GET", "HEAD")
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and "replica" in self._db.engines:
+            if self._flushing or isinstance(clause, UpdateBase):
+                use_primary(self)
+            elif reads_from_replica(self):
+                return self._db.engines["replica"]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def reads_from_replica(session):
+    return (
+        has_request_context()
+        and request.method in READ_METHODS
+        and not session.info.get("pinned_to_primary")
+    )
+
+
+def use_primary(session):
+    # Send all further statements in this session (the current request)
+    # to the primary
+    session.info["pinned_to_primary"] = True
@@ -0,0 +1,287 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+from flask import Response, current_app, g, jsonify, request
+from werkzeug.utils import import_string
+from compression import COMPRESSIBLE, SUFFIXES, brotli, compress_body, etag_variants, negotiate
+
+# Server-side cache of whole GET responses (RESPONSE_CACHE_ENABLED). A hit
+# skips the view entirely: no SQL, no relationship loads, no dump. Entries
+# hold the serialized body and, with RESPONSE_CACHE_PRECOMPRESS, its gzip
+# and brotli variants, so a hit is a dictionary lookup and a memory copy.
+#
+# Views opt in with @cached(tags...). Tags name what a response was built
+# from: "character:<id>" for one row, and the bare table name ("character")
+# for anything listing or aggregating rows. Write paths don't touch the
+# cache themselves. record_changes() (controllers/changes.py) marks the
+# tags of every row it records, and commit_or_abort() drops the matching
+# entries once the transaction has committed. A renamed lookup therefore
+# also drops every cached character that embeds it, since those are tagged
+# "affiliation:<id>" when they are stored.
+#
+# The default backend is an in-process LRU bounded by
+# RESPONSE_CACHE_MAX_BYTES, with RESPONSE_CACHE_TTL seconds per entry.
+# Invalidation is exact within the worker; other workers see a change once
+# their copy expires. RESPONSE_CACHE_BACKEND names a ResponseCacheBackend
+# subclass ("package.module:Class") for a store shared by all workers.
+
+STALE_TAGS = "stale_response_tags"
+# Response headers kept with the body
+STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Link")
+# Rough per-entry bookkeeping cost on top of the bodies
+ENTRY_OVERHEAD = 512
+
+
+class ResponseCacheBackend:
+    # Interface for cache stores. Entries are dicts of str/bytes/int values
+    # (see ResponseCache.store), so a shared backend can serialize them
+    # as they are.
+
+    def __init__(self, app):
+        self.app = app
+
+    def get(self, key):
+        # The entry, or None when missing or expired
+        raise NotImplementedError
+
+    def set(self, key, entry, tags, ttl):
+        raise NotImplementedError
+
+    def invalidate(self, tags):
+        # Drop every entry stored with any of the tags
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class MemoryBackend(ResponseCacheBackend):
+    # LRU over an OrderedDict, evicting least recently used entries once
+    # the stored bytes exceed max_bytes. A tag -> keys index makes
+    # invalidation proportional to the entries it drops.
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.max_bytes = app.config["RESPONSE_CACHE_MAX_BYTES"]
+        self.entries = OrderedDict()  # key -> (entry, tags, expires, size)
+        self.by_tag = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            found = self.entries.get(key)
+            if found is None:
+                return None
+            if found[2] is not None and found[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return found[0]
+
+    def set(self, key, entry, tags, ttl):
+        size = ENTRY_OVERHEAD + len(key) + sum(len(body) for body in entry["bodies"].values())
+        if size > self.max_bytes:
+            return
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (entry, tags, expires, size)
+            self.bytes += size
+            for tag in tags:
+                self.by_tag.setdefault(tag, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                for key in list(self.by_tag.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.by_tag.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        _, tags, _, size = self.entries.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self.by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_tag[tag]
+
+    def stats(self):
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "tags": len(self.by_tag),
+        }
+
+
+class ResponseCache:
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        # Bumped on every invalidation: a response built while one happened
+        # may predate the change, so it isn't stored
+        self.generation = 0
+
+    def init_app(self, app):
+        name = app.config["RESPONSE_CACHE_BACKEND"]
+        backend_class = MemoryBackend if name is None else import_string(name.replace(":", "."))
+        self.backend = backend_class(app)
+
+    @property
+    def enabled(self):
+        return self.backend is not None and current_app.config["RESPONSE_CACHE_ENABLED"]
+
+    def key(self):
+        args = sorted(request.args.items(multi=True))
+        return f"{request.path}?{urlencode(args)}"
+
+    def store(self, key, response, tags):
+        data = response.get_data()
+        bodies = {"identity": data}
+        config = current_app.config
+        if (
+            config["RESPONSE_CACHE_PRECOMPRESS"]
+            and config["COMPRESSION_ENABLED"]
+            and response.mimetype in COMPRESSIBLE
+            and len(data) >= config["COMPRESSION_MIN_SIZE"]
+        ):
+            for encoding in SUFFIXES:
+                if encoding != "br" or brotli is not None:
+                    bodies[encoding] = compress_body(encoding, data)
+        entry = {
+            "status": response.status_code,
+            "headers": [(name, response.headers[name]) for name in STORED_HEADERS if name in response.headers],
+            "etag": response.get_etag()[0],
+            "bodies": bodies,
+        }
+        self.backend.set(key, entry, tags, config["RESPONSE_CACHE_TTL"])
+        self.stores += 1
+
+    def respond(self, entry):
+        # 304 when the client holds the current ETag (either encoding)
+        etag = entry["etag"]
+        if etag is not None and request.if_none_match:
+            for candidate in etag_variants(etag):
+                if request.if_none_match.contains_weak(candidate):
+                    headers = [(name, value) for name, value in entry["headers"] if name == "Last-Modified"]
+                    response = Response(status=304, headers=headers)
+                    response.set_etag(candidate)
+                    return response
+
+        response = current_app.response_class(
+            entry["bodies"]["identity"], status=entry["status"], headers=entry["headers"]
+        )
+        if len(entry["bodies"]) > 1:
+            encoding = negotiate()
+            response.vary.add("Accept-Encoding")
+            if encoding in entry["bodies"]:
+                # Already compressed; the compression hook leaves it alone
+                response.set_data(entry["bodies"][encoding])
+                response.headers["Content-Encoding"] = encoding
+                response.set_etag(etag + SUFFIXES[encoding])
+        return response
+
+    def invalidate(self, tags):
+        if self.backend is None or not tags:
+            return
+        self.generation += 1
+        self.invalidations += 1
+        self.backend.invalidate(tags)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else None,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            **(self.backend.stats() if self.backend is not None else {}),
+        }
+
+
+response_cache = ResponseCache()
+
+
+def cached(*tags):
+    # Caches the view's 200 responses. Tags may use the view's arguments,
+    # e.g. "character:{id}"; the view can add more with tag().
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not response_cache.enabled:
+                return view(**kwargs)
+            key = response_cache.key()
+            entry = response_cache.backend.get(key)
+            if entry is not None:
+                response_cache.hits += 1
+                response = response_cache.respond(entry)
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response_cache.misses += 1
+            generation = response_cache.generation
+            g.response_cache_tags = {tag.format(**kwargs) for tag in tags}
+            response = current_app.make_response(view(**kwargs))
+            if (
+                response.status_code == 200
+                and not response.is_streamed
+                and generation == response_cache.generation
+            ):
+                response_cache.store(key, response, g.response_cache_tags)
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def tag(*tags):
+    # More tags for the response being built, e.g. the lookups it embeds
+    if "response_cache_tags" in g:
+        g.response_cache_tags.update(tags)
+
+
+def mark_stale(session, tags):
+    # Called by write paths; the entries are dropped after the commit
+    if current_app.config["RESPONSE_CACHE_ENABLED"]:
+        session.info.setdefault(STALE_TAGS, set()).update(tags)
+
+
+def invalidate_stale(session, committed=True):
+    tags = session.info.pop(STALE_TAGS, None)
+    if committed and tags:
+        response_cache.invalidate(tags)
+
+
+def stats_view():
+    return jsonify(response_cache.stats())
+
+
+def init_app(app):
+    response_cache.init_app(app)
+    app.add_url_rule("/cache/responses", "response_cache_stats", stats_view)
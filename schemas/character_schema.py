@@ -1,5 +1,5 @@
 from init import ma
-from marshmallow import fields
+from marshmallow import fields, validate
 from schemas.lookup_schema import affiliations_schema, occupations_schema
 
 
@@ -15,7 +15,33 @@ class CharacterSchema(ma.SQLAlchemyAutoSchema):
     occupations = fields.Nested(occupations_schema, many=True)
     affiliation_ids = fields.List(fields.Int(), load_only=True)
     occupation_ids = fields.List(fields.Int(), load_only=True)
+    # Link lookups by name; names that don't exist yet are created
+    affiliation_names = fields.List(fields.Str(validate=validate.Length(min=1)), load_only=True)
+    occupation_names = fields.List(fields.Str(validate=validate.Length(min=1)), load_only=True)
+    # Change single links without resending the whole list
+    add_affiliation_ids = fields.List(fields.Int(), load_only=True)
+    remove_affiliation_ids = fields.List(fields.Int(), load_only=True)
+    add_occupation_ids = fields.List(fields.Int(), load_only=True)
+    remove_occupation_ids = fields.List(fields.Int(), load_only=True)
 
 
 character_schema = CharacterSchema()
 characters_schema = CharacterSchema(many=True)
+# Typeahead results only carry what a suggestion list needs
+search_results_schema = CharacterSchema(many=True, only=("id", "name"))
+
+
+_fieldset_schemas = {}
+
+
+def character_schema_for(only, many=False):
+    # CharacterSchema limited to a sparse fieldset. Instances are reused per
+    # field tuple so their fields are bound, and their fast serializer
+    # compiled, only once.
+    if only is None:
+        return characters_schema if many else character_schema
+    key = (only, many)
+    schema = _fieldset_schemas.get(key)
+    if schema is None:
+        schema = _fieldset_schemas[key] = CharacterSchema(only=only, many=many)
+    return schema
@@ -0,0 +1,80 @@
+import keyword
+from marshmallow import fields
+from marshmallow.decorators import POST_DUMP, PRE_DUMP
+
+# Read-path serializer producing exactly what Schema.dump() produces, for
+# schemas built from the field types below. On first use per schema
+# instance it generates a plain Python function that reads each attribute
+# and converts it inline, skipping marshmallow's per-field dispatch.
+# Schemas with any other field type, or with pre_dump/post_dump hooks (at
+# any nesting level), fall back to Schema.dump().
+#
+# Marshmallow stays in charge of load/validation; this only replaces dump.
+
+_compiled = {}
+
+
+def _converter(field, name, index, helpers):
+    # Returns an expression converting the local variable `name`, or None if
+    # the field type isn't supported
+    if type(field) is fields.Int:
+        return f"(None if {name} is None else int({name}))"
+    if type(field) is fields.Str:
+        return f"(None if {name} is None else str({name}))"
+    if type(field) is fields.Date and field.format in (None, "iso"):
+        return f"(None if {name} is None else {name}.isoformat())"
+    if type(field) is fields.Nested:
+        nested = field.schema
+        dump_one = _compile_one(nested)
+        if dump_one is None:
+            return None
+        helper = f"_nested_{index}"
+        helpers[helper] = dump_one
+        if nested.many or field.many:
+            return f"(None if {name} is None else [{helper}(item) for item in {name}])"
+        return f"(None if {name} is None else {helper}({name}))"
+    return None
+
+
+def _compile_one(schema):
+    # Generates fn(obj) -> dict for a single object, or returns None
+    if schema._hooks[PRE_DUMP] or schema._hooks[POST_DUMP]:
+        return None
+    helpers = {}
+    lines = ["def _dump_one(obj):"]
+    items = []
+    for index, (key, field) in enumerate(schema.dump_fields.items()):
+        name = f"v{index}"
+        expression = _converter(field, name, index, helpers)
+        if expression is None:
+            return None
+        attribute = field.attribute or key
+        if attribute.isidentifier() and not keyword.iskeyword(attribute):
+            lines.append(f"    {name} = obj.{attribute}")
+        else:
+            lines.append(f"    {name} = getattr(obj, {attribute!r})")
+        items.append(f"{(field.data_key or key)!r}: {expression}")
+    lines.append("    return {" + ", ".join(items) + "}")
+    namespace = dict(helpers)
+    exec("\n".join(lines), namespace)
+    return namespace["_dump_one"]
+
+
+def compile_serializer(schema):
+    # Returns fn(obj_or_list) equivalent to schema.dump, or None
+    key = id(schema)
+    if key not in _compiled:
+        dump_one = _compile_one(schema)
+        if dump_one is not None and schema.many:
+            def dump(data):
+                return [dump_one(obj) for obj in data]
+        else:
+            dump = dump_one
+        # The schema is kept alongside so its id() can't be reused while cached
+        _compiled[key] = (schema, dump)
+    return _compiled[key][1]
+
+
+def fast_dump(schema, data):
+    dump = compile_serializer(schema)
+    return dump(data) if dump is not None else schema.dump(data)
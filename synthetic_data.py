@@ -0,0 +1,157 @@
+import csv
+import io
+import random
+import time
+from datetime import date
+from init import db
+from models.character import Character
+from models.lookup_tables import Affiliation, Occupation
+from models.junction_tables import character_affiliation, character_occupation
+from models.timestamps import utcnow
+from controllers.lookup_cache import bump_version, lookup_caches
+from controllers.changes import CHARACTER, record_changes
+from response_cache import invalidate_stale
+
+# Deterministic synthetic dataset for load testing. Rows are generated and
+# written chunk by chunk (multi-row INSERTs, or COPY on PostgreSQL) and each
+# chunk is committed, so memory stays flat however many rows are requested.
+
+FIRST_NAMES = [
+    "Uso", "Katejina", "Cronicle", "Marbet", "Mahalia", "Fuala", "Fonse", "Amuro", "Char",
+    "Kamille", "Judau", "Banagher", "Setsuna", "Kira", "Athrun", "Lalah", "Haman", "Quattro",
+]
+LAST_NAMES = [
+    "Ewin", "Loos", "Asher", "Fingerhat", "Merrill", "Griffon", "Kagatie", "Ray", "Aznable",
+    "Bidan", "Ashta", "Links", "Seiei", "Yamato", "Zala", "Sune", "Karn", "Bajeena",
+]
+CLASSIFICATIONS = ["newtype", "oldtype", "cyber-newtype", "coordinator", "innovator"]
+PLACES = ["Earth", "Side 1", "Side 2", "Side 3", "Side 7", "Luna", "Jupiter Colony", None]
+RANKS = ["Pilot", "Ensign", "Lieutenant", "Captain", "Commander", "Major", "Supreme Commander", None]
+STATUSES = ["Alive", "Killed In Action", "Missing In Action", "Unknown"]
+
+
+def parse_fanout(spec):
+    # "0:0.2,1:0.5,2:0.3" -> ([0, 1, 2], [0.2, 0.5, 0.3]): links per character and their weights
+    counts, weights = [], []
+    try:
+        for part in spec.split(","):
+            count, weight = part.split(":")
+            counts.append(int(count))
+            weights.append(float(weight))
+    except ValueError:
+        raise ValueError(f"Invalid fan-out distribution: {spec!r}")
+    if any(count < 0 for count in counts) or any(weight < 0 for weight in weights) or sum(weights) <= 0:
+        raise ValueError(f"Invalid fan-out distribution: {spec!r}")
+    return counts, weights
+
+
+def next_id(model):
+    return (db.session.scalar(db.select(db.func.max(model.id))) or 0) + 1
+
+
+def write_rows(table, rows):
+    # COPY is the fastest bulk path on PostgreSQL; elsewhere executemany,
+    # which SQLAlchemy batches into multi-row INSERTs
+    if not rows:
+        return
+    connection = db.session.connection()
+    if connection.dialect.name == "postgresql":
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            f'COPY "{table.name}" ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+    else:
+        connection.execute(table.insert(), rows)
+
+
+def reset_sequences():
+    # Rows were written with explicit ids, so move PostgreSQL's sequences on
+    if db.session.connection().dialect.name != "postgresql":
+        return
+    for model in (Character, Affiliation, Occupation):
+        table = model.__tablename__
+        db.session.execute(db.text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+        ))
+
+
+def seed_synthetic(
+    count,
+    affiliations=50,
+    occupations=30,
+    affiliation_fanout="0:0.2,1:0.5,2:0.2,3:0.1",
+    occupation_fanout="0:0.1,1:0.7,2:0.2",
+    seed=0,
+    chunk_size=10000,
+    progress=None,
+):
+    rnd = random.Random(seed)
+    affiliation_counts, affiliation_weights = parse_fanout(affiliation_fanout)
+    occupation_counts, occupation_weights = parse_fanout(occupation_fanout)
+    now = utcnow()
+
+    # Lookups first; their ids are needed for the junction rows
+    lookup_ids = {}
+    for model, amount in ((Affiliation, affiliations), (Occupation, occupations)):
+        start = next_id(model)
+        ids = list(range(start, start + amount))
+        write_rows(model.__table__, [
+            {"id": _id, "name": f"{model.__name__} {_id}", "updated_at": now} for _id in ids
+        ])
+        lookup_ids[model] = ids
+        record_changes(model.__tablename__, ids)
+        bump_version(lookup_caches[model].name)
+    db.session.commit()
+    invalidate_stale(db.session)
+
+    links = [
+        (character_affiliation, "affiliation_id", lookup_ids[Affiliation], affiliation_counts, affiliation_weights),
+        (character_occupation, "occupation_id", lookup_ids[Occupation], occupation_counts, occupation_weights),
+    ]
+
+    started = time.perf_counter()
+    first_id = next_id(Character)
+    for chunk_start in range(0, count, chunk_size):
+        ids = range(first_id + chunk_start, first_id + min(chunk_start + chunk_size, count))
+        rows = [
+            {
+                "id": _id,
+                "name": f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}",
+                "birth_year": date(rnd.randint(1, 200), rnd.randint(1, 12), rnd.randint(1, 28)),
+                "classification": rnd.choice(CLASSIFICATIONS),
+                "place_of_birth": rnd.choice(PLACES),
+                "rank": rnd.choice(RANKS),
+                "status": rnd.choice(STATUSES),
+                "updated_at": now,
+            }
+            for _id in ids
+        ]
+        write_rows(Character.__table__, rows)
+        record_changes(CHARACTER, ids)
+        for junction, column, pool, counts, weights in links:
+            junction_rows = []
+            fanouts = rnd.choices(counts, weights, k=len(ids))
+            for _id, fanout in zip(ids, fanouts):
+                for linked_id in rnd.sample(pool, min(fanout, len(pool))):
+                    junction_rows.append({"character_id": _id, column: linked_id})
+            write_rows(junction, junction_rows)
+        db.session.commit()
+        invalidate_stale(db.session)
+
+        if progress:
+            done = chunk_start + len(ids)
+            elapsed = time.perf_counter() - started
+            progress(done, count, elapsed)
+
+    reset_sequences()
+    db.session.commit()
+    for cache in lookup_caches.values():
+        cache.invalidate()
@@ -0,0 +1,71 @@
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from init import db
+import instrumentation
+from controllers.lookup_cache import lookup_caches
+from schemas.character_schema import character_schema, characters_schema, search_results_schema
+from schemas.lookup_schema import affiliation_schema, affiliations_schema, occupation_schema, occupations_schema
+from schemas.fast_serializer import compile_serializer
+
+# Work otherwise done lazily by the first requests a worker serves, run at
+# boot instead (see gunicorn.conf.py). prime_code() only builds Python
+# objects, so under preload_app it runs once in the master and the forked
+# workers share the result; connections and the lookup cache are per worker.
+# Finally a few read requests go through the app in-process, which fills
+# SQLAlchemy's per-engine compiled statement cache and Flask's first-request
+# paths. Their status doesn't matter, an empty database still warms them.
+
+READ_SCHEMAS = (
+    character_schema, characters_schema, search_results_schema,
+    affiliation_schema, affiliations_schema, occupation_schema, occupations_schema,
+)
+
+WARM_UP_PATHS = (
+    "/characters/?limit=1",
+    "/characters/1/",
+    "/characters/search?q=warm",
+    "/lookups/affiliations/",
+    "/lookups/occupations/",
+)
+
+
+def prime_code():
+    # Mapper configuration and the generated fast serializers
+    configure_mappers()
+    for schema in READ_SCHEMAS:
+        compile_serializer(schema)
+
+
+def open_connections(engine):
+    # Fills the pool up to its size so early requests don't pay for connects
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.execute(text("SELECT 1"))
+        connection.close()
+    return len(connections)
+
+
+def dispose_engines(app):
+    # In a freshly forked worker: forget connections inherited from the
+    # master without closing them, since the master still owns the sockets
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def warm_up(app, lookups=True):
+    started = time.perf_counter()
+    prime_code()
+    with app.app_context():
+        connections = sum(open_connections(engine) for engine in db.engines.values())
+        if lookups:
+            for cache in lookup_caches.values():
+                cache.warm()
+    client = app.test_client()
+    for path in WARM_UP_PATHS:
+        client.get(path)
+    # Keep the warm-up requests out of /metrics
+    instrumentation.registry.reset()
+    return {"connections": connections, "seconds": time.perf_counter() - started}